@@ -0,0 +1,236 @@
+#Shared setup for the load benchmarks: environment defaults, an in-process app on mongomock (or a real
+#mongod), a fake SMTP server, fake OAuth providers and a MongoDB operation counter.
+#Everything here has to run before src.config is imported, call setup() first.
+import email, itertools, os, re, threading, time
+from collections import defaultdict
+
+
+ENVIRONMENT_DEFAULTS = {
+    'PORT': '5000',
+    'MONGO_URI': 'mongodb://localhost:27017/flask_starter_kit_benchmark',
+    'SECRET_KEY': 'benchmark-secret-key',
+    'SERIALIZER_SECRET_KEY': 'benchmark-serializer-secret-key',
+    'MAIL_SERVER': 'smtp.benchmark.test',
+    'MAIL_USERNAME': 'benchmark',
+    'MAIL_PASSWORD': 'benchmark',
+    'GITHUB_CLIENT_ID': 'benchmark',
+    'GITHUB_CLIENT_SECRET': 'benchmark',
+    'GOOGLE_CLIENT_ID': 'benchmark',
+    'GOOGLE_CLIENT_SECRET': 'benchmark',
+    #Counters for every simulated client IP would otherwise pile up in MongoDB
+    'RATELIMIT_STORAGE_URI': 'memory://',
+}
+
+#Commands that aren't issued by request handlers
+IGNORED_COMMANDS = {'isMaster', 'hello', 'ping', 'endSessions', 'buildInfo', 'getMore', 'killCursors', 'saslStart', 'saslContinue'}
+
+
+class MongoOperationCounter():
+    """Counts MongoDB operations, in total and for the calling thread (the request being measured)."""
+
+    def __init__(self):
+        self.total = 0
+        self.by_name = defaultdict(int)
+        self._local = threading.local()
+        self._lock = threading.Lock()
+
+    def record(self, name):
+        with self._lock:
+            self.total += 1
+            self.by_name[name] += 1
+        self._local.count = getattr(self._local, 'count', 0) + 1
+
+    def thread_count(self):
+        return getattr(self._local, 'count', 0)
+
+
+mongo_operations = MongoOperationCounter()
+
+
+def count_mongomock_operations():
+    import mongomock.collection
+
+    methods = ['find', 'find_one', 'insert_one', 'insert_many', 'update_one', 'update_many', 'replace_one', 'delete_one',
+               'delete_many', 'bulk_write', 'find_one_and_update', 'count_documents', 'aggregate', 'create_indexes']
+    #mongomock implements some of these on top of the others (find_one -> find), only the outer call is an operation
+    nesting = threading.local()
+
+    for name in methods:
+        original = getattr(mongomock.collection.Collection, name)
+        def counted(self, *args, _original=original, _name=name, **kwargs):
+            depth = getattr(nesting, 'depth', 0)
+            if depth == 0:
+                mongo_operations.record(_name)
+            nesting.depth = depth + 1
+            try:
+                return _original(self, *args, **kwargs)
+            finally:
+                nesting.depth = depth
+        setattr(mongomock.collection.Collection, name, counted)
+
+
+def count_pymongo_commands():
+    from pymongo import monitoring
+
+    class CommandCounter(monitoring.CommandListener):
+        def started(self, event):
+            if event.command_name not in IGNORED_COMMANDS:
+                mongo_operations.record(event.command_name)
+
+        def succeeded(self, event):
+            pass
+
+        def failed(self, event):
+            pass
+
+    monitoring.register(CommandCounter())
+
+
+class FakeSMTP():
+    """Stands in for smtplib.SMTP, keeps the sent messages so flows can follow the links in them."""
+
+    latency = 0.0
+    outbox = defaultdict(list)
+    lock = threading.Condition()
+
+    def __init__(self, host='', port=0, timeout=None, **kwargs):
+        time.sleep(self.latency)
+
+    def starttls(self, *args, **kwargs):
+        time.sleep(self.latency)
+
+    def login(self, username, password):
+        pass
+
+    def noop(self):
+        return (250, b'OK')
+
+    def sendmail(self, sender, recipients, message, mail_options=(), rcpt_options=()):
+        time.sleep(self.latency)
+        with self.lock:
+            for recipient in recipients:
+                self.outbox[recipient].append(message)
+            self.lock.notify_all()
+        return {}
+
+    def quit(self):
+        pass
+
+    def close(self):
+        pass
+
+    @classmethod
+    def sent_count(cls, recipient):
+        with cls.lock:
+            return len(cls.outbox.get(recipient, []))
+
+    @classmethod
+    def last_link(cls, recipient, pattern, sent, timeout=10):
+        """Link from the newest message to recipient, waiting until there are more than `sent` (see sent_count).
+
+        Without a broker emails go out on a background thread (src/tasks.py), after the request has returned.
+        """
+        with cls.lock:
+            if not cls.lock.wait_for(lambda: len(cls.outbox.get(recipient, [])) > sent, timeout):
+                return None
+            messages = list(cls.outbox[recipient])
+
+        for raw in reversed(messages):
+            message = email.message_from_bytes(raw) if isinstance(raw, bytes) else email.message_from_string(raw)
+            for part in message.walk():
+                payload = part.get_payload(decode=True)
+                if payload:
+                    match = re.search(pattern, payload.decode('utf-8', 'replace'))
+                    if match:
+                        return match.group(0)
+        return None
+
+
+class FakeOAuthProviders():
+    """Answers the token exchange and userinfo calls of the OAuth client (requests) for Google and GitHub.
+
+    The authorization code picks the identity, so the same code logs the same person in again.
+    """
+
+    latency = 0.0
+
+    def install(self):
+        import requests
+        from requests.adapters import HTTPAdapter
+
+        def send(adapter, request, **kwargs):
+            time.sleep(self.latency)
+            response = requests.Response()
+            response.status_code, body = self.respond(request)
+            response._content = body.encode('utf-8')
+            response.headers['Content-Type'] = 'application/json'
+            response.url = request.url
+            response.request = request
+            return response
+
+        HTTPAdapter.send = send
+
+    def respond(self, request):
+        import json
+        from urllib.parse import parse_qs
+
+        url = request.url
+        if 'oauth2/token' in url or 'access_token' in url:
+            code = parse_qs(request.body if isinstance(request.body, str) else (request.body or b'').decode()).get('code', ['0'])[0]
+            return 200, json.dumps({'access_token': f'token-{code}', 'token_type': 'bearer'})
+
+        identity = request.headers.get('Authorization', 'Bearer token-0').rsplit('-', 1)[-1]
+        if 'googleapis.com' in url:
+            return 200, json.dumps({'sub': f'google-{identity}', 'email': f'oauth{identity}@benchmark.test', 'email_verified': True,
+                                    'given_name': f'OAuth {identity}', 'picture': None})
+        if url.endswith('/user/emails'):
+            return 200, json.dumps([{'email': f'oauth{identity}@benchmark.test', 'primary': True, 'verified': True}])
+        if 'api.github.com/user' in url:
+            return 200, json.dumps({'id': int(identity), 'name': f'OAuth {identity}', 'avatar_url': None, 'bio': None})
+        return 404, '{}'
+
+
+def setup(production=True, mongo_uri=None, smtp_latency=0.0, oauth_latency=0.0):
+    """Prepare the environment and the fakes, must be called before anything from src is imported."""
+    for key, value in ENVIRONMENT_DEFAULTS.items():
+        os.environ.setdefault(key, value)
+    os.environ['PRODUCTION'] = 'true' if production else 'false'
+    if mongo_uri:
+        os.environ['MONGO_URI'] = mongo_uri
+
+    if mongo_uri:
+        count_pymongo_commands()
+    else:
+        import mongomock, flask_pymongo
+        flask_pymongo.MongoClient = mongomock.MongoClient
+        count_mongomock_operations()
+
+    import smtplib
+    FakeSMTP.latency = smtp_latency
+    smtplib.SMTP = smtplib.SMTP_SSL = FakeSMTP
+
+    providers = FakeOAuthProviders()
+    providers.latency = oauth_latency
+    providers.install()
+
+
+def create_benchmark_app(bcrypt_rounds=None):
+    from server import create_app
+    from src.extensions import password_hasher
+    from src.user_repository import user_repository
+
+    app = create_app()
+    #Unique indexes matter for the flows, verify_indexes is left out (explain() isn't available on mongomock)
+    with app.app_context():
+        user_repository.ensure_indexes()
+    if bcrypt_rounds:
+        password_hasher.rounds = bcrypt_rounds
+    return app
+
+
+_ip_counter = itertools.count(1)
+
+def next_client_ip():
+    #Every virtual user gets its own address (X-Real-IP, see src.utils.ProxyFix), like real traffic
+    number = next(_ip_counter)
+    return f'10.{(number >> 16) & 255}.{(number >> 8) & 255}.{number & 255}'
@@ -0,0 +1,276 @@
+#Load test: virtual users driving a mix of anonymous page views, logins, registrations, password resets
+#and OAuth sign-ins against an in-process create_app(), reporting requests/sec, p50/p95/p99 latency and
+#MongoDB operations per request for every route.
+#MongoDB is mongomock (pip install -r benchmarks/requirements.txt) unless --mongo is given, SMTP and the OAuth providers are faked (benchmarks/harness.py).
+#Run from the project root, e.g. `python -m benchmarks.load --duration 30 --users 16 --compare default`
+#Results can be stored with --save-baseline NAME (benchmarks/baselines/NAME.json) and compared with --compare NAME.
+#Numbers are only comparable between runs with the same options on the same machine.
+import argparse, json, os, random, re, threading, time, uuid
+from collections import defaultdict
+
+from benchmarks import harness
+
+
+BASELINE_DIR = os.path.join(os.path.dirname(__file__), 'baselines')
+
+PASSWORD = 'Benchmark-passw0rd'
+ANONYMOUS_PAGES = ['/', '/about', '/explore', '/documentation', '/contact', '/privacy-policy', '/terms-and-conditions', '/login', '/register']
+#Minified templates may drop the attribute quotes
+CSRF_PATTERN = re.compile(r'id="?csrf"?\s+value="?([^"\s>]+)')
+
+#Scenario -> weight, roughly what a public site with a login sees
+SCENARIOS = {
+    'browse': 60,
+    'login': 20,
+    'register': 8,
+    'password_reset': 6,
+    'oauth': 6
+}
+
+
+def percentile(samples, p):
+    return samples[min(len(samples) - 1, int(len(samples) * p / 100))]
+
+
+class Recorder():
+    def __init__(self):
+        self.samples = defaultdict(list) # step -> [(latency, status, mongo operations)]
+        self.lock = threading.Lock()
+
+    def add(self, step, latency, status, operations):
+        with self.lock:
+            self.samples[step].append((latency, status, operations))
+
+
+class VirtualUser():
+    """One visitor at a time: every scenario starts with a new client (cookies) and a new IP address."""
+
+    def __init__(self, app, recorder, seeds, rng):
+        self.app = app
+        self.recorder = recorder
+        self.seeds = seeds
+        self.rng = rng
+
+    def new_visitor(self):
+        self.client = self.app.test_client()
+        self.client.environ_base['HTTP_X_REAL_IP'] = harness.next_client_ip()
+        self.client.environ_base['HTTP_USER_AGENT'] = 'flask-starter-kit-benchmark'
+        self.client.environ_base['HTTP_ACCEPT_LANGUAGE'] = 'en-US,en;q=0.9'
+
+    def request(self, step, method, path, **kwargs):
+        before = harness.mongo_operations.thread_count()
+        start = time.perf_counter()
+        response = self.client.open(path, method=method, **kwargs)
+        data = response.get_data(as_text=True)
+        latency = time.perf_counter() - start
+        self.recorder.add(step, latency, response.status_code, harness.mongo_operations.thread_count() - before)
+        return response, data
+
+    def csrf_token(self, step, path):
+        _, data = self.request(step, 'GET', path)
+        match = CSRF_PATTERN.search(data)
+        return match.group(1) if match else ''
+
+    def browse(self):
+        for path in self.rng.sample(ANONYMOUS_PAGES, self.rng.randint(1, 4)):
+            self.request(f'GET {path}', 'GET', path)
+
+    def login(self):
+        email = self.rng.choice(self.seeds['login'])
+        token = self.csrf_token('GET /login', '/login')
+        #Some visitors mistype their password
+        password = PASSWORD if self.rng.random() > 0.1 else 'Wrong-passw0rd'
+        response, _ = self.request('POST /login', 'POST', '/login', json={'email': email, 'password': password, 'remember': True, '_csrf_token': token})
+        if response.status_code == 200:
+            self.request('GET /admin', 'GET', '/admin')
+            self.request('GET /logout', 'GET', '/logout')
+
+    def register(self):
+        email = f'user-{uuid.uuid4().hex[:12]}@benchmark.test'
+        token = self.csrf_token('GET /register', '/register')
+        sent = harness.FakeSMTP.sent_count(email)
+        response, _ = self.request('POST /register', 'POST', '/register', json={'email': email, 'password': PASSWORD, 'terms': True, '_csrf_token': token})
+        if response.status_code == 200 and self.rng.random() < 0.5:
+            link = harness.FakeSMTP.last_link(email, r'/verify-email/[^"\s<]+', sent)
+            if link:
+                self.request('GET /verify-email/<token>', 'GET', link)
+
+    def password_reset(self):
+        #Separate accounts, a reset changes the alternative_id and would log out the login scenario's sessions
+        email = self.rng.choice(self.seeds['reset'])
+        token = self.csrf_token('GET /forgot-password', '/forgot-password')
+        sent = harness.FakeSMTP.sent_count(email)
+        response, _ = self.request('POST /forgot-password', 'POST', '/forgot-password', json={'email': email, '_csrf_token': token})
+        link = harness.FakeSMTP.last_link(email, r'/reset-password/[^"\s<]+', sent) if response.status_code == 200 else None
+        if link:
+            _, data = self.request('GET /reset-password/<token>', 'GET', link)
+            match = CSRF_PATTERN.search(data)
+            self.request('POST /reset-password', 'POST', '/reset-password', json={
+                'password': PASSWORD,
+                'confirm_password': PASSWORD,
+                'token': link.rsplit('/', 1)[-1],
+                '_csrf_token': match.group(1) if match else ''
+            })
+
+    def oauth(self):
+        provider = self.rng.choice(['github', 'google'])
+        #GitHub and Google identities don't overlap, the same email on both would go through account linking
+        identity = self.rng.randint(1, 50) + (0 if provider == 'github' else 1000)
+        response, _ = self.request('GET /authorize/<provider>', 'GET', f'/authorize/{provider}')
+        state = re.search(r'state=([^&]+)', response.headers.get('Location', ''))
+        self.request('GET /callback/<provider>', 'GET', f'/callback/{provider}', query_string={'code': identity, 'state': state.group(1) if state else ''})
+
+    def run(self, deadline):
+        names, weights = list(SCENARIOS), list(SCENARIOS.values())
+        while time.monotonic() < deadline:
+            self.new_visitor()
+            getattr(self, self.rng.choices(names, weights)[0])()
+
+
+def seed_users(app, count):
+    from src.extensions import password_hasher
+    from src.user_repository import user_repository
+    from src.blueprints.auth.auth_utils import build_user
+
+    #Only ever touch the benchmark's own accounts, --mongo could point at a shared database
+    user_repository.collection.delete_many({'email': {'$regex': r'@benchmark\.test$'}})
+
+    seeds = {'login': [], 'reset': []}
+    #build_user takes the language from the request
+    with app.test_request_context(headers={'Accept-Language': 'en'}):
+        password_hash = password_hasher.generate_password_hash(PASSWORD)
+        for kind in seeds:
+            for index in range(count):
+                email = f'{kind}{index}@benchmark.test'
+                user = build_user({'email': email, 'password_hash': password_hash, 'alternative_id': str(uuid.uuid4()),
+                                   'auth_provider': 'local', 'name': f'{kind} {index}'})
+                user['email_verified'] = True
+                user_repository.insert(user)
+                seeds[kind].append(email)
+    return seeds
+
+
+def summarize(samples, elapsed):
+    latencies = sorted(latency for latency, _, _ in samples)
+    statuses = defaultdict(int)
+    for _, status, _ in samples:
+        statuses[str(status)] += 1
+
+    return {
+        'requests': len(samples),
+        'rps': round(len(samples) / elapsed, 2),
+        'p50_ms': round(percentile(latencies, 50) * 1000, 2),
+        'p95_ms': round(percentile(latencies, 95) * 1000, 2),
+        'p99_ms': round(percentile(latencies, 99) * 1000, 2),
+        'mongo_ops_per_request': round(sum(operations for _, _, operations in samples) / len(samples), 2),
+        'statuses': dict(sorted(statuses.items()))
+    }
+
+
+def run(args):
+    app = harness.create_benchmark_app(args.bcrypt_rounds)
+    seeds = seed_users(app, args.seed_users)
+
+    #Warm up: first-use template compilation, connection pools
+    warmup = VirtualUser(app, Recorder(), seeds, random.Random(0))
+    for scenario in SCENARIOS:
+        warmup.new_visitor()
+        getattr(warmup, scenario)()
+
+    recorder = Recorder()
+    operations_before = harness.mongo_operations.total
+    deadline = time.monotonic() + args.duration
+    users = [VirtualUser(app, recorder, seeds, random.Random(args.seed + index)) for index in range(args.users)]
+    threads = [threading.Thread(target=user.run, args=(deadline,)) for user in users]
+
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    from src.user_repository import user_repository
+    user_repository.write_buffer.flush()
+
+    all_samples = [sample for samples in recorder.samples.values() for sample in samples]
+    attributed = sum(operations for _, _, operations in all_samples)
+    return {
+        'options': {
+            'duration': args.duration,
+            'users': args.users,
+            'production': args.production,
+            'mongo': 'mongodb' if args.mongo else 'mongomock',
+            'bcrypt_rounds': args.bcrypt_rounds or app.config.get('BCRYPT_LOG_ROUNDS'),
+            'smtp_latency': args.smtp_latency,
+            'oauth_latency': args.oauth_latency
+        },
+        'total': summarize(all_samples, elapsed),
+        'steps': {step: summarize(samples, elapsed) for step, samples in sorted(recorder.samples.items())},
+        #Write buffer flushes and other work outside the measured requests
+        'background_mongo_ops': harness.mongo_operations.total - operations_before - attributed
+    }
+
+
+def print_results(results):
+    total = results['total']
+    print(f"{total['requests']} requests, {total['rps']} req/s, p50 {total['p50_ms']}ms, p95 {total['p95_ms']}ms, "
+          f"p99 {total['p99_ms']}ms, {total['mongo_ops_per_request']} mongo ops/request "
+          f"(+{results['background_mongo_ops']} in the background)")
+    print(f"{'step':<32} {'requests':>9} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'mongo':>6}  statuses")
+    for step, stats in results['steps'].items():
+        statuses = ' '.join(f'{status}:{count}' for status, count in stats['statuses'].items())
+        print(f"{step:<32} {stats['requests']:>9} {stats['rps']:>8} {stats['p50_ms']:>8} {stats['p95_ms']:>8} "
+              f"{stats['p99_ms']:>8} {stats['mongo_ops_per_request']:>6}  {statuses}")
+
+
+def print_comparison(results, baseline, name):
+    def change(current, previous):
+        return f"{(current - previous) / previous * 100:+.1f}%" if previous else 'n/a'
+
+    if baseline['options'] != results['options']:
+        print(f"Warning: baseline {name} was recorded with different options: {baseline['options']}")
+
+    print(f"\nCompared to baseline {name}:")
+    print(f"{'step':<32} {'req/s':>9} {'p50':>9} {'p95':>9} {'p99':>9} {'mongo':>9}")
+    rows = [('total', results['total'], baseline['total'])]
+    rows += [(step, stats, baseline['steps'][step]) for step, stats in results['steps'].items() if step in baseline['steps']]
+    for step, current, previous in rows:
+        print(f"{step:<32} {change(current['rps'], previous['rps']):>9} {change(current['p50_ms'], previous['p50_ms']):>9} "
+              f"{change(current['p95_ms'], previous['p95_ms']):>9} {change(current['p99_ms'], previous['p99_ms']):>9} "
+              f"{change(current['mongo_ops_per_request'], previous['mongo_ops_per_request']):>9}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test every route with a realistic traffic mix")
+    parser.add_argument('--duration', type=float, default=30, help="seconds")
+    parser.add_argument('--users', type=int, default=16, help="concurrent virtual users (threads)")
+    parser.add_argument('--development', dest='production', action='store_false', help="run with PRODUCTION=false")
+    parser.add_argument('--mongo', help="use a real MongoDB (e.g. mongodb://localhost:27017/benchmark) instead of mongomock")
+    parser.add_argument('--smtp-latency', type=float, default=0.05, help="seconds per SMTP command")
+    parser.add_argument('--oauth-latency', type=float, default=0.1, help="seconds per OAuth provider request")
+    parser.add_argument('--bcrypt-rounds', type=int, help="defaults to BCRYPT_LOG_ROUNDS")
+    parser.add_argument('--seed-users', type=int, default=50)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--save-baseline', metavar='NAME')
+    parser.add_argument('--compare', metavar='NAME')
+    args = parser.parse_args()
+
+    harness.setup(args.production, args.mongo, args.smtp_latency, args.oauth_latency)
+    results = run(args)
+    print_results(results)
+
+    if args.compare:
+        with open(os.path.join(BASELINE_DIR, f'{args.compare}.json')) as f:
+            print_comparison(results, json.load(f), args.compare)
+
+    if args.save_baseline:
+        os.makedirs(BASELINE_DIR, exist_ok=True)
+        path = os.path.join(BASELINE_DIR, f'{args.save_baseline}.json')
+        with open(path, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"Saved baseline to {path}")
+
+
+if __name__ == '__main__':
+    main()
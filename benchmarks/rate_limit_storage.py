@@ -0,0 +1,79 @@
+#Added latency per rate limited request for each limiter storage backend.
+#Run from the project root: `python -m benchmarks.rate_limit_storage [--mongo mongodb://localhost:27017/limits_benchmark]`
+#MongoDB backends are skipped when the server isn't reachable.
+import argparse, random, statistics, threading, time
+
+from limits import RateLimitItemPerMinute
+from limits.storage import storage_from_string
+from limits.strategies import FixedWindowRateLimiter
+
+import src.rate_limit_storage # registers the custom schemes
+
+
+def percentile(samples, p):
+    return samples[min(len(samples) - 1, int(len(samples) * p / 100))]
+
+
+def run(uri, threads, hits, keys):
+    storage = storage_from_string(uri)
+    limiter = FixedWindowRateLimiter(storage)
+    #Same shape as the auth limits, never actually exceeded here
+    limit = RateLimitItemPerMinute(10 ** 9)
+    storage.reset()
+
+    samples = [[] for _ in range(threads)]
+    def worker(index):
+        for _ in range(hits):
+            key = f'127.0.0.{random.randrange(keys)}'
+            start = time.perf_counter()
+            limiter.hit(limit, 'auth.login', key)
+            samples[index].append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    workers = [threading.Thread(target=worker, args=(index,)) for index in range(threads)]
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    merged = sorted(sample for thread_samples in samples for sample in thread_samples)
+    return {
+        'mean': statistics.mean(merged) * 1e6,
+        'p50': percentile(merged, 50) * 1e6,
+        'p99': percentile(merged, 99) * 1e6,
+        'throughput': len(merged) / elapsed
+    }
+
+
+def mongo_reachable(uri):
+    from pymongo import MongoClient
+    try:
+        MongoClient(uri, serverSelectionTimeoutMS=1000).admin.command('ping')
+        return True
+    except Exception:
+        return False
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare rate limit storage backends")
+    parser.add_argument('--mongo', default='mongodb://localhost:27017/limits_benchmark')
+    parser.add_argument('--threads', type=int, default=8, help="like WAITRESS_THREADS")
+    parser.add_argument('--hits', type=int, default=2000, help="hits per thread")
+    parser.add_argument('--keys', type=int, default=500, help="distinct client addresses")
+    args = parser.parse_args()
+
+    backends = ['memory://', 'sharded-memory://?shards=16']
+    if mongo_reachable(args.mongo):
+        backends += [args.mongo, 'hybrid+' + args.mongo + ('&' if '?' in args.mongo else '?') + 'sync=1']
+    else:
+        print(f"MongoDB at {args.mongo} is not reachable, skipping the mongodb backends")
+
+    print(f"{'backend':<60}{'mean':>10}{'p50':>10}{'p99':>10}{'hits/s':>12}")
+    for uri in backends:
+        result = run(uri, args.threads, args.hits, args.keys)
+        print(f"{uri:<60}{result['mean']:>8.1f}us{result['p50']:>8.1f}us{result['p99']:>8.1f}us{result['throughput']:>12.0f}")
+
+
+if __name__ == '__main__':
+    main()
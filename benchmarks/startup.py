@@ -0,0 +1,95 @@
+#Cold start: time to import server.py, run create_app() and answer the first requests, each run in a fresh interpreter.
+#Run from the project root: `python -m benchmarks.startup [--runs 10] [--development]`
+#MongoDB isn't contacted (index checks are off, the client connects lazily), so no database is needed.
+#The first (warm-up) run fills the template cache, the measured runs fail if a template is still compiled while answering a request.
+#Results can be stored with --save-baseline NAME and compared with --compare NAME (benchmarks/baselines/startup-NAME.json).
+import argparse, json, os, statistics, subprocess, sys, time
+
+from benchmarks.harness import ENVIRONMENT_DEFAULTS
+
+
+BASELINE_DIR = os.path.join(os.path.dirname(__file__), 'baselines')
+FIRST_REQUESTS = ['/', '/login']
+PHASES = ['import', 'create_app', 'first_request', 'total']
+
+
+def measure():
+    start = time.perf_counter()
+    from src import config
+    import server
+    imported = time.perf_counter()
+
+    app = server.create_app()
+    created = time.perf_counter()
+
+    client = app.test_client()
+    for path in FIRST_REQUESTS:
+        response = client.get(path, headers={'Accept-Language': 'en'})
+        assert response.status_code == 200, (path, response.status_code)
+    done = time.perf_counter()
+
+    from src.extensions import template_cache
+    template_stats = template_cache.bytecode_cache.stats if template_cache.bytecode_cache else {}
+    print(json.dumps({
+        'import': imported - start,
+        'create_app': created - imported,
+        'first_request': done - created,
+        'total': done - start,
+        'modules': len(sys.modules),
+        'templates_compiled': template_stats.get('compiled'),
+        'templates_compiled_in_request': template_stats.get('compiled_in_request')
+    }))
+
+
+def run(production):
+    environment = {**ENVIRONMENT_DEFAULTS, **os.environ, 'PRODUCTION': 'true' if production else 'false'}
+    output = subprocess.run([sys.executable, '-m', 'benchmarks.startup', '--measure'], env=environment,
+                            capture_output=True, text=True, check=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure time to first request in fresh processes")
+    parser.add_argument('--runs', type=int, default=10)
+    parser.add_argument('--development', dest='production', action='store_false', help="run with PRODUCTION=false")
+    parser.add_argument('--measure', action='store_true', help=argparse.SUPPRESS)
+    parser.add_argument('--save-baseline', metavar='NAME')
+    parser.add_argument('--compare', metavar='NAME')
+    args = parser.parse_args()
+
+    if args.measure:
+        measure()
+        return
+
+    run(args.production) # warm up the filesystem cache and bytecode
+    samples = [run(args.production) for _ in range(args.runs)]
+    compiled = [sample['templates_compiled_in_request'] for sample in samples]
+    assert not any(compiled), f"Templates were compiled while answering requests: {compiled}"
+    results = {
+        'options': {'production': args.production, 'runs': args.runs},
+        'modules': samples[-1]['modules']
+    }
+    for phase in PHASES:
+        values = sorted(sample[phase] for sample in samples)
+        results[phase] = {'median_ms': round(statistics.median(values) * 1000, 1), 'min_ms': round(values[0] * 1000, 1)}
+        print(f"{phase:<14} median {results[phase]['median_ms']:>7}ms   min {results[phase]['min_ms']:>7}ms")
+    print(f"{results['modules']} modules loaded, {samples[-1]['templates_compiled']} templates compiled")
+
+    if args.compare:
+        with open(os.path.join(BASELINE_DIR, f'startup-{args.compare}.json')) as f:
+            baseline = json.load(f)
+        print(f"\nCompared to baseline {args.compare}:")
+        for phase in PHASES:
+            previous, current = baseline[phase]['median_ms'], results[phase]['median_ms']
+            print(f"{phase:<14} {previous:>7}ms -> {current:>7}ms ({(current - previous) / previous * 100:+.1f}%)")
+
+    if args.save_baseline:
+        os.makedirs(BASELINE_DIR, exist_ok=True)
+        path = os.path.join(BASELINE_DIR, f'startup-{args.save_baseline}.json')
+        with open(path, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"Saved baseline to {path}")
+
+
+if __name__ == '__main__':
+    main()
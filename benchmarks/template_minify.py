@@ -0,0 +1,64 @@
+#Per-request CPU time of rendering pages with the runtime Minify vs templates minified at load time.
+#Run from the project root with the usual environment (.env), e.g. `python -m benchmarks.template_minify`
+#Only pages that don't touch MongoDB are requested, so the database doesn't have to be reachable.
+import argparse, json, os, statistics, subprocess, sys, time
+
+
+PAGES = ['/', '/login', '/register', '/forgot-password', '/this-page-does-not-exist']
+
+
+def run(minify_templates, requests):
+    os.environ['PRODUCTION'] = 'true'
+
+    from src import config
+    config.MINIFY_TEMPLATES = minify_templates
+
+    from server import create_app
+    app = create_app()
+    headers = {'Accept-Language': 'en', 'Accept-Encoding': 'identity'}
+
+    results = {}
+    for page in PAGES:
+        #Warm up (template compilation, first-load minification)
+        app.test_client().get(page, headers=headers)
+
+        samples, size = [], 0
+        for _ in range(requests):
+            #A new visitor every time, each gets their own CSRF token so Flask-Minify's own cache doesn't hit
+            client = app.test_client()
+            start = time.process_time()
+            response = client.get(page, headers=headers)
+            samples.append(time.process_time() - start)
+            size = len(response.data)
+
+        results[page] = {'cpu_ms': statistics.mean(samples) * 1000, 'bytes': size}
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare per-request CPU time of runtime vs load-time template minification")
+    parser.add_argument('--requests', type=int, default=200, help="requests per page")
+    parser.add_argument('--mode', choices=['runtime', 'templates'], help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.mode:
+        print(json.dumps(run(args.mode == 'templates', args.requests)))
+        return
+
+    #Each mode in its own process, config and extensions are set up at import time
+    results = {}
+    for mode in ('runtime', 'templates'):
+        output = subprocess.run([sys.executable, '-m', 'benchmarks.template_minify', '--mode', mode, '--requests', str(args.requests)],
+                                capture_output=True, text=True, check=True).stdout
+        results[mode] = json.loads(output.strip().splitlines()[-1])
+
+    print(f"{'page':<28}{'runtime Minify':>18}{'minified templates':>22}{'saved':>10}")
+    for page in PAGES:
+        before, after = results['runtime'][page], results['templates'][page]
+        saved = 1 - after['cpu_ms'] / before['cpu_ms']
+        print(f"{page:<28}{before['cpu_ms']:>11.2f} ms/req{after['cpu_ms']:>15.2f} ms/req{saved:>10.0%}")
+        print(f"{'':<28}{before['bytes']:>12} bytes{after['bytes']:>16} bytes")
+
+
+if __name__ == '__main__':
+    main()
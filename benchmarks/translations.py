@@ -0,0 +1,88 @@
+#Rendering of the _()-heavy pages per locale, with Flask-Babel's lazily loaded catalogs and with the preloaded
+#per-locale tables (src/translation_catalogs.py), each in a fresh interpreter.
+#Run from the project root: `python -m benchmarks.translations [--renders 500] [--production]`
+#Flask-Babel only reads .mo files, run `pybabel compile -d translations` first for a fair comparison.
+#'first' is the first render of the locale in the process (catalog loading included), 'render' the median afterwards.
+#Results can be stored with --save-baseline NAME and compared with --compare NAME (benchmarks/baselines/translations-NAME.json).
+import argparse, json, os, statistics, subprocess, sys, time
+
+from benchmarks.harness import ENVIRONMENT_DEFAULTS
+
+
+BASELINE_DIR = os.path.join(os.path.dirname(__file__), 'baselines')
+PAGES = ['pages/home.html', 'pages/privacy-policy.html', 'pages/about.html', 'pages/404.html']
+VARIANTS = {'flask-babel': False, 'preloaded': True}
+
+
+def measure(preload, renders):
+    from src import config
+    config.PRELOAD_TRANSLATIONS = preload
+    import server
+    from flask import render_template
+
+    app = server.create_app()
+    results = {}
+    for language in config.ACCEPTED_LANGUAGES:
+        def render():
+            with app.test_request_context('/', headers={'Accept-Language': language}):
+                start = time.perf_counter()
+                for page in PAGES:
+                    render_template(page, locale=language)
+                return time.perf_counter() - start
+
+        first = render()
+        samples = sorted(render() for _ in range(renders))
+        results[language] = {'first_ms': round(first * 1000, 3), 'render_ms': round(statistics.median(samples) * 1000, 3)}
+    print(json.dumps(results))
+
+
+def run(preload, renders, production):
+    environment = {**ENVIRONMENT_DEFAULTS, **os.environ, 'PRODUCTION': 'true' if production else 'false'}
+    command = [sys.executable, '-m', 'benchmarks.translations', '--measure', '--renders', str(renders)]
+    if preload:
+        command.append('--preload')
+    output = subprocess.run(command, env=environment, capture_output=True, text=True, check=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure _()-heavy template rendering per locale")
+    parser.add_argument('--renders', type=int, default=500, help="renders of the page set per locale")
+    parser.add_argument('--production', action='store_true', help="run with PRODUCTION=true (minified templates)")
+    parser.add_argument('--measure', action='store_true', help=argparse.SUPPRESS)
+    parser.add_argument('--preload', action='store_true', help=argparse.SUPPRESS)
+    parser.add_argument('--save-baseline', metavar='NAME')
+    parser.add_argument('--compare', metavar='NAME')
+    args = parser.parse_args()
+
+    if args.measure:
+        measure(args.preload, args.renders)
+        return
+
+    results = {'options': {'production': args.production, 'renders': args.renders, 'pages': PAGES}}
+    for variant, preload in VARIANTS.items():
+        results[variant] = run(preload, args.renders, args.production)
+
+    print(f"{'locale':<8}" + ''.join(f"{variant + ' first':>22}{variant + ' render':>22}" for variant in VARIANTS))
+    for language in results['preloaded']:
+        row = ''.join(f"{results[variant][language]['first_ms']:>20}ms{results[variant][language]['render_ms']:>20}ms" for variant in VARIANTS)
+        print(f"{language:<8}{row}")
+
+    if args.compare:
+        with open(os.path.join(BASELINE_DIR, f'translations-{args.compare}.json')) as f:
+            baseline = json.load(f)
+        print(f"\nPreloaded render compared to baseline {args.compare}:")
+        for language, current in results['preloaded'].items():
+            previous = baseline['preloaded'][language]['render_ms']
+            print(f"{language:<8}{previous:>9}ms -> {current['render_ms']:>9}ms ({(current['render_ms'] - previous) / previous * 100:+.1f}%)")
+
+    if args.save_baseline:
+        os.makedirs(BASELINE_DIR, exist_ok=True)
+        path = os.path.join(BASELINE_DIR, f'translations-{args.save_baseline}.json')
+        with open(path, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"Saved baseline to {path}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,8 @@
+#Entry point for the Celery worker: celery -A make_celery worker --loglevel=info
+from server import create_app
+from src.celery_app import ensure_celery
+
+flask_app = create_app()
+celery_app = ensure_celery(flask_app)
+
+import src.tasks
@@ -1,37 +1,21 @@
-import logging
+import logging, signal, sys
 
-from flask import Flask, render_template, g
+from flask import Flask, render_template, jsonify, g
 from flask_login import current_user
 
-from celery import Celery, Task
-
-from src.extensions import init_extensions, mongo
-from src.utils import ProxyFix
+from src.extensions import init_extensions
+from src.password_hasher import PasswordHasherSaturated
+from src.user_repository import user_repository
+from src.blueprints.auth.auth_utils import set_cached_user_language
+from src.utils import ProxyFix, ProfilerMiddleware
+from src.cli import init_cli
 from src import config
 
 from src.blueprints.pages import pages
 from src.blueprints.auth.auth import auth
 
 from src.blueprints.admin.admin import admin_bp
-
-
-def make_celery(app: Flask) -> Celery:
-    class FlaskTask(Task):
-        def __call__(self, *args: object, **kwargs: object) -> object:
-            with app.app_context():
-                return self.run(*args, **kwargs)
-            
-    celery_app = Celery(
-        app.name,
-        backend=config.CELERY_RESULT_BACKEND,
-        broker=config.CELERY_BROKER_URL
-    )
-    
-    celery_app.Task = FlaskTask
-    celery_app.set_default()
-    app.extensions['celery'] = celery_app
-    
-    return celery_app
+from src.blueprints.health import health
 
 
 def create_app():
@@ -46,25 +30,47 @@ def create_app():
     
     
     app.config['MAIL_SERVER'] = config.MAIL_SERVER
-    app.config['MAIL_PORT'] = 587
-    app.config['MAIL_USE_TLS'] = True
+    app.config['MAIL_PORT'] = config.MAIL_PORT
+    app.config['MAIL_USE_TLS'] = config.MAIL_USE_TLS
     app.config['MAIL_USERNAME'] = config.MAIL_USERNAME
     app.config['MAIL_PASSWORD'] = config.MAIL_PASSWORD
     app.config['MAIL_DEFAULT_SENDER'] = config.MAIL_DEFAULT_SENDER
+    app.config['MAIL_POOL_SIZE'] = config.MAIL_POOL_SIZE
+    app.config['MAIL_POOL_MAX_IDLE'] = config.MAIL_POOL_MAX_IDLE
+    
+    app.config['PASSWORD_HASH_WORKERS'] = config.PASSWORD_HASH_WORKERS
+    app.config['PASSWORD_HASH_QUEUE_DEPTH'] = config.PASSWORD_HASH_QUEUE_DEPTH
+    app.config['PASSWORD_HASH_TIMEOUT'] = config.PASSWORD_HASH_TIMEOUT
+    
+    app.config['PAGE_CACHE_SIZE'] = config.PAGE_CACHE_SIZE
+    app.config['PAGE_CACHE_TTL'] = config.PAGE_CACHE_TTL
+    app.config['FRAGMENT_CACHE_SIZE'] = config.FRAGMENT_CACHE_SIZE
+    app.config['FRAGMENT_CACHE_TTL'] = config.FRAGMENT_CACHE_TTL
+    app.config['MINIFY_TEMPLATES'] = config.MINIFY_TEMPLATES
+    app.config['TEMPLATE_CACHE_DIR'] = config.TEMPLATE_CACHE_DIR
+    app.config['PRELOAD_TRANSLATIONS'] = config.PRELOAD_TRANSLATIONS
+    
+    app.config['WRITE_BUFFER_FLUSH_INTERVAL'] = config.WRITE_BUFFER_FLUSH_INTERVAL
+    app.config['WRITE_BUFFER_MAX_PENDING'] = config.WRITE_BUFFER_MAX_PENDING
 
 
     
-    app.wsgi_app = ProxyFix(app.wsgi_app)
+    profiler = ProfilerMiddleware(app.wsgi_app, app.url_map, config.PROFILER_SAMPLE_RATE, config.PROFILER_MODE, config.PROFILER_INTERVAL)
+    app.extensions['profiler'] = profiler
+    app.wsgi_app = ProxyFix(profiler)
 
     init_extensions(app)
+    init_cli(app)
+    user_repository.write_buffer.init_app(app)
 
-    # make_celery(app)
+    #Celery is set up on the first queued task (src.celery_app.ensure_celery)
     
 
     app.register_blueprint(pages)
     app.register_blueprint(auth)
     
     app.register_blueprint(admin_bp)
+    app.register_blueprint(health)
 
     @app.errorhandler(400)
     def bad_request(e):
@@ -79,6 +85,10 @@ def create_app():
     def page_not_found(e):
         return render_template('pages/404.html')
     
+    @app.errorhandler(PasswordHasherSaturated)
+    def password_hasher_saturated(e):
+        return jsonify({'success': False, 'message': 'The server is busy right now. Please try again in a moment.'}), 503, {'Retry-After': '5'}
+    
 
     @app.after_request
     def set_lang_cookie(response):
@@ -87,15 +97,55 @@ def create_app():
             g.set_lang_cookie = False
             
         if g.get('set_user_locale', False):
-            mongo.db.users.update_one({'alternative_id': current_user.get_id()}, {'$set': {'preferences.language': g.lang}})
+            #The lang cookie is sent with every request, only write when the preference actually changed
+            if current_user.additional_user_data.get('language') != g.lang:
+                user_repository.set_language(current_user.get_id(), g.lang)
+                set_cached_user_language(current_user.get_id(), g.lang)
             g.set_user_locale = False
             
         return response
+    
+    @app.after_request
+    def add_server_timing(response):
+        if 'password_hash_time' in g:
+            response.headers.add('Server-Timing', f"bcrypt;dur={g.password_hash_time * 1000:.1f}")
+        return response
 
     return app
 
 
+def prepare_database():
+    """Create and check the users indexes once per start, not in every (pre-forked) worker or CLI run."""
+    if not (config.MONGO_ENSURE_INDEXES or config.MONGO_VERIFY_INDEXES):
+        return
+
+    from src.extensions import mongo
+
+    #Just the MongoDB client, closed again so no connection is inherited by the workers
+    app = Flask(__name__)
+    app.config['MONGO_URI'] = config.MONGO_URI
+    mongo.init_app(app)
+    try:
+        with app.app_context():
+            if config.MONGO_ENSURE_INDEXES:
+                user_repository.ensure_indexes()
+            if config.MONGO_VERIFY_INDEXES:
+                user_repository.verify_indexes()
+    finally:
+        mongo.cx.close()
+
+
 if __name__ == '__main__':
+    prepare_database()
+
+    if config.PRODUCTION and config.WEB_WORKERS > 1:
+        logging.info("🚨 Running in PRODUCTION mode 🚨")
+
+        #The app is created in every worker, after the fork
+        from src.prefork import Arbiter
+        Arbiter().run()
+        sys.exit(0)
+
     app = create_app()
     
     logging.info(f"\n🎉 Starting server on http://{config.HOST}:{config.PORT} 🎉")
@@ -103,8 +153,13 @@ if __name__ == '__main__':
     if config.PRODUCTION:
         logging.info("🚨 Running in PRODUCTION mode 🚨")
         
-        from waitress import serve
-        serve(app, host=config.HOST, port=config.PORT, threads=config.WAITRESS_THREADS)
+        from waitress import create_server
+        from src.extensions import metrics
+        #Exit cleanly on docker stop so atexit handlers (buffered writes) still run
+        signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+        server = create_server(app, host=config.HOST, port=config.PORT, threads=config.WAITRESS_THREADS)
+        metrics.watch_waitress(server)
+        server.run()
 
     else:
         logging.info("🚨 Running in DEVELOPMENT mode 🚨")
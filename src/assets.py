@@ -0,0 +1,186 @@
+#Static asset pipeline: content-hashed copies, precompressed siblings (.br/.zst/.gz) and a manifest.
+#Built after Tailwind with `python -m src.assets` (see Dockerfile) or `flask assets build`.
+#This module doesn't import src.config, so it runs at image build time without environment variables.
+import gzip, hashlib, json, logging, mimetypes, os
+
+import brotli
+import zstandard
+from flask import current_app, request, send_from_directory, g
+
+
+STATIC_FOLDER = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'static')
+OUTPUT_FOLDER = 'dist' # relative to STATIC_FOLDER
+MANIFEST_FILE = os.path.join(STATIC_FOLDER, OUTPUT_FOLDER, 'manifest.json')
+
+#Sources that are never served directly
+IGNORED_FOLDERS = ('src',)
+#Files that are served from the root by the pages blueprint, their names can't change
+IGNORED_FILES = ('robots.txt', 'sitemap.xml')
+
+COMPRESSIBLE_EXTENSIONS = ('.css', '.js', '.svg', '.json', '.txt', '.xml', '.ico', '.html')
+#Same minifiers Flask-Minify would run on these at request time
+MINIFIED_EXTENSIONS = {
+    '.js': 'script',
+    '.css': 'style',
+}
+PRECOMPRESSED_SUFFIXES = {
+    'br': '.br',
+    'zstd': '.zst',
+    'gzip': '.gz',
+}
+
+
+def load_manifest(path=MANIFEST_FILE):
+    if not os.path.exists(path):
+        return {}
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def hashed_name(relative_path, content):
+    digest = hashlib.sha256(content).hexdigest()[:12]
+    root, ext = os.path.splitext(relative_path)
+    #static/dist/css/output.css -> dist/css/output.<hash>.css, static/js/x.js -> dist/js/x.<hash>.js
+    if root.startswith(OUTPUT_FOLDER + '/'):
+        root = root[len(OUTPUT_FOLDER) + 1:]
+    return f"{OUTPUT_FOLDER}/{root}.{digest}{ext}"
+
+
+def minify(relative_path, content):
+    tag = MINIFIED_EXTENSIONS.get(os.path.splitext(relative_path)[1])
+    if tag is None:
+        return content
+
+    #Only used when building, the web process never needs the minifiers
+    from flask_minify.parsers import Parser
+    parser = Parser(fail_safe=True)
+    parser.update_runtime_options(html=False, js=True, cssless=True)
+    return parser.minify(content.decode('utf-8'), tag).encode('utf-8')
+
+
+def precompress(path, content):
+    encodings = []
+    variants = {
+        'br': lambda: brotli.compress(content, quality=11),
+        'zstd': lambda: zstandard.ZstdCompressor(level=19).compress(content),
+        'gzip': lambda: gzip.compress(content, compresslevel=9, mtime=0),
+    }
+    for encoding, compress in variants.items():
+        compressed = compress()
+        #Not worth serving if it barely shrinks
+        if len(compressed) < len(content) * 0.9:
+            with open(path + PRECOMPRESSED_SUFFIXES[encoding], 'wb') as f:
+                f.write(compressed)
+            encodings.append(encoding)
+    return encodings
+
+
+def collect_sources(previous_manifest):
+    previous_outputs = {entry['path'] for entry in previous_manifest.values()}
+
+    for folder, dirs, files in os.walk(STATIC_FOLDER):
+        relative_folder = os.path.relpath(folder, STATIC_FOLDER).replace(os.sep, '/')
+        if relative_folder == '.':
+            relative_folder = ''
+            dirs[:] = [d for d in dirs if d not in IGNORED_FOLDERS]
+
+        for name in files:
+            relative_path = f"{relative_folder}/{name}" if relative_folder else name
+            if relative_path in IGNORED_FILES or relative_path in previous_outputs:
+                continue
+            if relative_path == os.path.relpath(MANIFEST_FILE, STATIC_FOLDER).replace(os.sep, '/'):
+                continue
+            if name.endswith(tuple(PRECOMPRESSED_SUFFIXES.values())):
+                continue
+            yield relative_path
+
+
+def build():
+    previous_manifest = load_manifest()
+
+    #Remove outputs of the previous build so stale hashes don't pile up
+    for entry in previous_manifest.values():
+        for suffix in [''] + list(PRECOMPRESSED_SUFFIXES.values()):
+            path = os.path.join(STATIC_FOLDER, entry['path'] + suffix)
+            if os.path.exists(path):
+                os.remove(path)
+
+    manifest = {}
+    for relative_path in sorted(collect_sources(previous_manifest)):
+        source = os.path.join(STATIC_FOLDER, relative_path)
+        with open(source, 'rb') as f:
+            content = minify(relative_path, f.read())
+
+        output = hashed_name(relative_path, content)
+        output_path = os.path.join(STATIC_FOLDER, output)
+        os.makedirs(os.path.dirname(output_path), exist_ok=True)
+        with open(output_path, 'wb') as f:
+            f.write(content)
+
+        encodings = []
+        if relative_path.endswith(COMPRESSIBLE_EXTENSIONS):
+            encodings = precompress(output_path, content)
+
+        manifest[relative_path] = {'path': output, 'encodings': encodings}
+        logging.info("Built %s -> %s %s", relative_path, output, encodings)
+
+    os.makedirs(os.path.dirname(MANIFEST_FILE), exist_ok=True)
+    with open(MANIFEST_FILE, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+
+    return manifest
+
+
+class StaticAssets():
+    """Resolves url_for('static', ...) through the manifest and serves the hashed files.
+
+    Hashed files never change, so they are sent with an immutable Cache-Control header
+    and, when the client accepts it, straight from the precompressed sibling.
+    """
+
+    def __init__(self):
+        self.manifest = {}
+        self.encodings = {}
+
+    def init_app(self, app):
+        self.manifest = load_manifest()
+        if not self.manifest:
+            logging.warning("No static asset manifest found, serving unversioned static files. Run `python -m src.assets`")
+            return
+
+        self.encodings = {entry['path']: entry['encodings'] for entry in self.manifest.values()}
+        self.max_age = app.config.get('STATIC_ASSETS_MAX_AGE', 60 * 60 * 24 * 365)
+
+        app.url_defaults(self.resolve_static_url)
+        app.view_functions['static'] = self.send_static
+
+    def resolve_static_url(self, endpoint, values):
+        if endpoint == 'static' and values.get('filename') in self.manifest:
+            values['filename'] = self.manifest[values['filename']]['path']
+
+    def send_static(self, filename):
+        if filename not in self.encodings:
+            return current_app.send_static_file(filename)
+
+        encoding = request.accept_encodings.best_match(self.encodings[filename]) if self.encodings[filename] else None
+        path = filename + PRECOMPRESSED_SUFFIXES[encoding] if encoding else filename
+
+        #Minified at build time already
+        g.skip_minify = True
+
+        response = send_from_directory(current_app.static_folder, path, mimetype=guess_mimetype(filename), max_age=self.max_age)
+        if encoding:
+            response.headers['Content-Encoding'] = encoding
+        response.headers['Vary'] = 'Accept-Encoding'
+        response.headers['Cache-Control'] = f"public, max-age={self.max_age}, immutable"
+        return response
+
+
+def guess_mimetype(filename):
+    return mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    built = build()
+    print(f"Built {len(built)} static assets, manifest written to {MANIFEST_FILE}")
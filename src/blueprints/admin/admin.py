@@ -1,6 +1,9 @@
-from flask import Blueprint, render_template, request, jsonify, url_for
+import pstats
+from functools import wraps
 
-from flask_login import login_required
+from flask import Blueprint, render_template, request, jsonify, url_for, current_app, abort, Response
+
+from flask_login import login_required, current_user
 
 
 from src.localization import get_locale
@@ -8,9 +11,59 @@ from src.localization import get_locale
 admin_bp = Blueprint('admin', __name__)
 
 
+def admin_required(view):
+    @wraps(view)
+    @login_required
+    def wrapper(*args, **kwargs):
+        if 'admin' not in current_user.additional_user_data.get('roles', []):
+            abort(403)
+        return view(*args, **kwargs)
+    return wrapper
 
 
 @admin_bp.route('/admin')
 @login_required
 def admin():
-    return render_template('pages/admin/dashboard.html', locale=get_locale())
\ No newline at end of file
+    return render_template('pages/admin/dashboard.html', locale=get_locale())
+
+
+@admin_bp.route('/admin/profiler')
+@admin_required
+def profiler():
+    return jsonify(current_app.extensions['profiler'].summary())
+
+@admin_bp.route('/admin/profiler', methods=['POST'])
+@admin_required
+def profiler_settings():
+    profiler = current_app.extensions['profiler']
+    sample_rate = request.json.get('sample_rate')
+    mode = request.json.get('mode')
+
+    if sample_rate is not None:
+        if type(sample_rate) not in (int, float) or not 0 <= sample_rate <= 1:
+            return jsonify({'success': False, 'message': 'sample_rate must be a number between 0 and 1.'}), 400
+        profiler.sample_rate = sample_rate
+    if mode is not None:
+        if mode not in ('sampling', 'cprofile'):
+            return jsonify({'success': False, 'message': "mode must be 'sampling' or 'cprofile'."}), 400
+        profiler.mode = mode
+    if request.json.get('reset'):
+        profiler.reset()
+
+    return jsonify({'success': True} | profiler.summary())
+
+@admin_bp.route('/admin/profiler/stacks')
+@admin_required
+def profiler_stacks():
+    #Collapsed stacks, e.g. `flamegraph.pl stacks.txt > flamegraph.svg` or open the file in speedscope.app
+    return Response(current_app.extensions['profiler'].collapsed_stacks(request.args.get('endpoint')), mimetype='text/plain')
+
+@admin_bp.route('/admin/profiler/stats')
+@admin_required
+def profiler_stats():
+    sort = request.args.get('sort', 'cumulative')
+    if sort not in pstats.Stats.sort_arg_dict_default:
+        return jsonify({'success': False, 'message': f"sort must be one of {', '.join(pstats.Stats.sort_arg_dict_default)}."}), 400
+
+    report = current_app.extensions['profiler'].cprofile_report(request.args.get('endpoint'), sort)
+    return Response(report, mimetype='text/plain')
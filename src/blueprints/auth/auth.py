@@ -1,13 +1,13 @@
 
 import uuid, logging
-from datetime import datetime, timezone
 
 from flask import Blueprint, render_template, request, jsonify, session, redirect, url_for, g
 from flask_login import login_user, logout_user, current_user
 
 from src import config
 from src.localization import get_locale
-from src.extensions import limiter, bcrypt, mongo
+from src.extensions import limiter, password_hasher
+from src.user_repository import user_repository
 
 from src.blueprints.auth.auth_utils import validate_email, validate_password, rate_limit_exceeded, build_user, User
 
@@ -69,16 +69,15 @@ def register_post():
         return jsonify({'success': False, 'message': password_error}), 400
     
     
-    existing_user = mongo.db.users.find_one({'email': email})
     #Preventing user enumeration on used email is way too hardcode
-    if existing_user:    
+    if user_repository.email_exists(email):
         return jsonify({'success': False, 'message': 'User with that email already exists.'}), 400
     
-    password_hash = bcrypt.generate_password_hash(password).decode('utf-8')
+    password_hash = password_hasher.generate_password_hash(password)
     alternative_id = str(uuid.uuid4())
     
     
-    mongo.db.users.insert_one(build_user({
+    user_repository.insert(build_user({
         'email': email,
         'password_hash': password_hash,
         'alternative_id': alternative_id,
@@ -111,12 +110,12 @@ def login_post():
       
     
     
-    user = mongo.db.users.find_one({'email': email})
+    user = user_repository.find_for_login(email)
     if user:
         if user['auth_provider'] != 'local':
             #Provide feedback that this user is already registered with a different provider
             return jsonify({'success': False, 'message': 'An account already exists for this email. Please use your social login method to sign in.'}), 400
-        if bcrypt.check_password_hash(user['password'], password): 
+        if password_hasher.check_password_hash(user['password'], password):
             if user['account_status'] != 'active':
                 if user['account_status'] == 'deactivated':
                     return jsonify({'success': False, 'message': 'Your account has been deactivated. Please contact support for assistance.'}), 400
@@ -128,17 +127,7 @@ def login_post():
             elif not user['email_verified']:
                 return jsonify({'success': False, 'redirect': url_for('auth.verify_email.verify_email_page', email=email), 'message': 'Please verify your email address to activate your account. Check your inbox for a verification email or request a new one.'}), 400
                
-            mongo.db.users.update_one({'email': email},
-                {'$set': {
-                'last_login': datetime.now(tz=timezone.utc),
-                'metadata.last_login_ip': request.remote_addr,
-                'metadata.last_login_user_agent': request.headers.get('User-Agent'),
-                'security.failed_login_attempts': 0,
-                
-            },
-                 '$inc': {
-                'usage_stats.total_logins': 1
-            }})
+            user_repository.record_login(user, request.remote_addr, request.headers.get('User-Agent'))
             
             
             additional_data = {}
@@ -157,14 +146,11 @@ def login_post():
             login_user(userObject, remember=remember)
 
                 
-            logging.info(f"Additional data: {additional_data}")
+            logging.debug("Additional data: %s", additional_data)
 
             return jsonify({'success': True, 'message': 'User logged in successfully!'} | additional_data), 200
         else:
-            mongo.db.users.update_one({'email': email}, {'$inc': {
-                'security.failed_login_attempts': 1,
-                'usage_stats.total_failed_logins': 1
-                }})
+            user_repository.record_failed_login(user)
         
     return jsonify({'success': False, 'message': 'Incorrect email or password.'}), 401
 
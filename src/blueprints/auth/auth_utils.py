@@ -3,8 +3,16 @@ from flask import request, make_response, render_template, jsonify
 from datetime import datetime, timezone
 
 
-from src.extensions import mongo, login_manager
+from src.extensions import login_manager
 from src.localization import get_locale
+from src.user_repository import user_repository
+from src.cache import TTLCache
+from src import config
+
+
+#invalidate_user can't reach the other pre-forked workers, their entries expire after the shorter TTL instead
+user_cache = TTLCache(maxsize=config.USER_CACHE_SIZE,
+                      ttl=config.USER_CACHE_WORKERS_TTL if config.PRODUCTION and config.WEB_WORKERS > 1 else config.USER_CACHE_TTL)
 
 
 def validate_password(password):
@@ -134,9 +142,26 @@ class User():
         return self.id
     
     
+def invalidate_user(alternative_id):
+    """Drop a cached session user, call this after every write that changes a user."""
+    if alternative_id:
+        user_cache.invalidate(alternative_id)
+
+def set_cached_user_language(alternative_id, language):
+    #Buffered writes aren't in Mongo yet, so update the cached user instead of reloading it
+    user_data = user_cache.get(alternative_id)
+    if user_data:
+        user_cache.set(alternative_id, {**user_data, 'preferences': {**user_data.get('preferences', {}), 'language': language}})
+
+
 @login_manager.user_loader
 def load_user(alternative_id):
-    user_data = mongo.db.users.find_one({'alternative_id': alternative_id})
+    user_data = user_cache.get(alternative_id)
+    if user_data is None:
+        user_data = user_repository.find_for_session(alternative_id)
+        if user_data:
+            user_cache.set(alternative_id, user_data)
+        
     if user_data:
         is_active = user_data['account_status'] == 'active' and user_data['email_verified']
 
@@ -144,7 +169,8 @@ def load_user(alternative_id):
             'email': user_data['email'],
             'profile_picture': user_data['profile']['profile_picture'],
             'name': user_data['profile']['name'],
-            'roles': user_data['roles']
+            'roles': user_data['roles'],
+            'language': user_data.get('preferences', {}).get('language')
         }
         
         return User(user_data['alternative_id'], is_active_variable=is_active, additional_user_data_variable=additional_user_data)
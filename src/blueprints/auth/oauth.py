@@ -3,7 +3,7 @@ from datetime import datetime, timezone, timedelta
 import uuid
 
 from urllib.parse import urlencode
-import logging, secrets, requests
+import logging, secrets
 from json import JSONDecodeError
 
 
@@ -11,11 +11,13 @@ from flask import Blueprint, render_template, request, jsonify, url_for, redirec
 from flask_login import login_user, logout_user, current_user
 from flask_mail import Message
 
-from src.extensions import limiter, mongo, bcrypt
+from src.extensions import limiter, password_hasher
+from src.user_repository import user_repository
 from src.localization import get_locale
 from src import config
 
-from src.blueprints.auth.auth_utils import validate_email, rate_limit_exceeded, build_user, User
+from src.blueprints.auth.auth_utils import validate_email, rate_limit_exceeded, build_user, User, invalidate_user
+from src.blueprints.auth import oauth_client
 
 oauth_bp = Blueprint('oauth', __name__)
 
@@ -24,10 +26,14 @@ def oauth2_endpoint_request(provider, endpoint, oauth2_token):
     if not provider_data:
         abort(404)
     
-    response = requests.get(provider_data['endpoints'][endpoint], headers={
-        'Authorization': 'Bearer ' + oauth2_token,
-        'Accept': 'application/json'
-    })
+    try:
+        response = oauth_client.get(provider, provider_data['endpoints'][endpoint], headers={
+            'Authorization': 'Bearer ' + oauth2_token,
+            'Accept': 'application/json'
+        })
+    except oauth_client.RequestException as e:
+        logging.error("Error requesting %s from %s: %s", endpoint, provider, e)
+        abort(401)
     
     if response.status_code != 200:
         abort(401)
@@ -35,7 +41,7 @@ def oauth2_endpoint_request(provider, endpoint, oauth2_token):
     try:
         json_response = response.json()
     except JSONDecodeError as e:
-        logging.error(f"Error decoding JSON response from {provider}: {e}")
+        logging.error("Error decoding JSON response from %s: %s", provider, e)
         abort(401)
         
     return json_response
@@ -53,8 +59,10 @@ def get_oauth2_user_data(provider, oauth2_token):
         }
         
     elif provider == 'github':
-        userinfo = oauth2_endpoint_request(provider, 'userinfo', oauth2_token)
-        emailinfo = oauth2_endpoint_request(provider, 'emailinfo', oauth2_token)
+        userinfo, emailinfo = oauth_client.run_concurrently(
+            (oauth2_endpoint_request, provider, 'userinfo', oauth2_token),
+            (oauth2_endpoint_request, provider, 'emailinfo', oauth2_token)
+        )
                 
         for email in emailinfo:
             if email['primary']:
@@ -111,47 +119,51 @@ def callback_initialization(provider):
         
     provider_data = config.OAUTH2_PROVIDERS.get(provider)
     if not provider_data:
-        logging.debug(f"Provider not found: {provider}")
+        logging.debug("Provider not found: %s", provider)
         abort(404)
         
     if "error" in request.args:
         for key, value in request.args.items():
             if key.startswith("error"):
                 flash(f"Error: {value}", "error")
-                logging.error(f"Error from {provider}: {value}")
+                logging.error("Error from %s: %s", provider, value)
         return False, redirect(url_for('auth.login'))
     
     if request.args.get('state') != session.get('oauth2_state'):
-        logging.error(f"OAuth 2.0 state mismatch for {provider}")
+        logging.error("OAuth 2.0 state mismatch for %s", provider)
         abort(401)
         
     if "code" not in request.args:
-        logging.error(f"OAuth 2.0 code not provided for {provider}")
+        logging.error("OAuth 2.0 code not provided for %s", provider)
         abort(401)
         
     # exchange the authorization code for an access token
-    response = requests.post(provider_data['token_url'], data={
-        'client_id': provider_data['client_id'],
-        'client_secret': provider_data['client_secret'],
-        'code': request.args['code'],
-        'grant_type': 'authorization_code',
-        'redirect_uri': url_for('auth.oauth.oauth2_callback', provider=provider,
-        _external=True
-    )}, headers={'Accept': 'application/json'})
+    try:
+        response = oauth_client.post(provider, provider_data['token_url'], data={
+            'client_id': provider_data['client_id'],
+            'client_secret': provider_data['client_secret'],
+            'code': request.args['code'],
+            'grant_type': 'authorization_code',
+            'redirect_uri': url_for('auth.oauth.oauth2_callback', provider=provider,
+            _external=True
+        )}, headers={'Accept': 'application/json'})
+    except oauth_client.RequestException as e:
+        logging.error("Error exchanging authorization code for access token from %s: %s", provider, e)
+        abort(401)
     
     if response.status_code != 200:
-        logging.error(f"Error exchanging authorization code for access token from {provider}: {response.status_code} {response.text}")
+        logging.error("Error exchanging authorization code for access token from %s: %s %s", provider, response.status_code, response.text)
         abort(401)
     
     try:
         json_response = response.json()
     except JSONDecodeError as e:
-        logging.error(f"Error decoding JSON response from {provider}: {e}")
+        logging.error("Error decoding JSON response from %s: %s", provider, e)
         abort(401)
         
     oauth2_token = json_response.get('access_token')
     if not oauth2_token:
-        logging.debug(f"Access token not provided by {provider}")
+        logging.debug("Access token not provided by %s", provider)
         abort(401)
         
         
@@ -190,10 +202,10 @@ def oauth2_callback(provider):
         flash("Email not verified by OAuth 2.0 provider", "error")
         return redirect(url_for('auth.login'))
     
-    user = mongo.db.users.find_one({'email': user_data.get('email')})
+    user = user_repository.find_for_oauth(user_data.get('email'), provider)
     
     if not user:
-        logging.info(f"Creating user from OAuth 2.0 provider: {provider}, email: {user_data.get('email')}")
+        logging.info("Creating user from OAuth 2.0 provider: %s, email: %s", provider, user_data.get('email'))
         alternative_id = str(uuid.uuid4())
         
         user_model = build_user({
@@ -215,7 +227,7 @@ def oauth2_callback(provider):
             }
         })
         
-        user_id = mongo.db.users.insert_one(user_model).inserted_id
+        user_id = user_repository.insert(user_model).inserted_id
     
         userObject = User(alternative_id)
         
@@ -258,8 +270,8 @@ def oauth2_callback(provider):
                 }
             
             
-            mongo.db.users.update_one(
-                {'_id': user['_id']},
+            user_repository.update_by_id(
+                user['_id'],
                 {
                     '$set': {
                         'last_login': datetime.now(tz=timezone.utc),
@@ -274,6 +286,8 @@ def oauth2_callback(provider):
                     }
                 }
             )
+            if updated_fields:
+                invalidate_user(user['alternative_id'])
             
             alternative_id = user['alternative_id']
             
@@ -343,10 +357,10 @@ def oauth2_callback_link(provider):
             return redirect(url_for('auth.oauth.linking_status'))
             
         logging.debug("Linking request succeeded")
-        user = mongo.db.users.find_one({'email': user_data.get('email')})
+        user = user_repository.find_for_login(user_data.get('email'))
         
-        mongo.db.users.update_one(
-            {'_id': user['_id']},
+        user_repository.update_by_id(
+            user['_id'],
             {'$set': {
                     f'connections.{session["pending_oauth_connection"]["provider"]}': {
                         'oauth_id': session['pending_oauth_connection']['oauth_id'],
@@ -410,12 +424,12 @@ def link_account_post():
         session.pop('pending_oauth_connection')
         return jsonify({'success': False, 'message': 'Linking session expired. Please try again.'}), 400
     
-    user = mongo.db.users.find_one({'email': email})
+    user = user_repository.find_for_login(email)
         
     if user:
-        if bcrypt.check_password_hash(user['password'], password):
-            mongo.db.users.update_one(
-                {'_id': user['_id']},
+        if password_hasher.check_password_hash(user['password'], password):
+            user_repository.update_by_id(
+                user['_id'],
                 {'$set': {
                         f'connections.{session["pending_oauth_connection"]["provider"]}': {
                             'oauth_id': session['pending_oauth_connection']['oauth_id'],
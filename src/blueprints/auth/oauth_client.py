@@ -0,0 +1,82 @@
+import os, threading
+from concurrent.futures import ThreadPoolExecutor
+
+from src import config
+
+
+#One pooled session per provider, so DNS, TCP and TLS setup is paid once instead of per call
+_sessions = {}
+_executor = None
+_pid = None
+_lock = threading.Lock()
+
+
+def _reset_after_fork():
+    global _sessions, _executor, _pid
+    if _pid != os.getpid():
+        _sessions = {}
+        _executor = None
+        _pid = os.getpid()
+
+
+def __getattr__(name):
+    #oauth_client.RequestException, without importing requests before it's used
+    if name == 'RequestException':
+        from requests import RequestException
+        return RequestException
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def get_session(provider):
+    with _lock:
+        _reset_after_fork()
+        
+        session = _sessions.get(provider)
+        if session is None:
+            #requests (with urllib3 and certifi) is a big import, only paid once someone signs in with OAuth
+            import requests
+            from requests.adapters import HTTPAdapter
+            from urllib3.util.retry import Retry
+
+            #Only idempotent GETs are retried, the code exchange POST must not be replayed
+            retry = Retry(
+                total=config.OAUTH2_HTTP_RETRIES,
+                backoff_factor=0.2,
+                status_forcelist=(502, 503, 504),
+                allowed_methods=frozenset(['GET'])
+            )
+            adapter = HTTPAdapter(pool_connections=4, pool_maxsize=config.OAUTH2_HTTP_POOL_SIZE, max_retries=retry)
+            
+            session = requests.Session()
+            session.mount('https://', adapter)
+            session.mount('http://', adapter)
+            session.headers['Accept'] = 'application/json'
+            
+            _sessions[provider] = session
+        return session
+
+
+def get(provider, url, **kwargs):
+    kwargs.setdefault('timeout', config.OAUTH2_HTTP_TIMEOUT)
+    return get_session(provider).get(url, **kwargs)
+
+
+def post(provider, url, **kwargs):
+    kwargs.setdefault('timeout', config.OAUTH2_HTTP_TIMEOUT)
+    return get_session(provider).post(url, **kwargs)
+
+
+def run_concurrently(*calls):
+    """Run independent (function, *args) calls in parallel and return their results in order.
+
+    Exceptions (including aborts) raised by any call are re-raised in the caller.
+    """
+    global _executor
+    with _lock:
+        _reset_after_fork()
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=config.OAUTH2_HTTP_POOL_SIZE, thread_name_prefix='oauth2-http')
+        executor = _executor
+    
+    futures = [executor.submit(call[0], *call[1:]) for call in calls]
+    return [future.result() for future in futures]
@@ -2,12 +2,11 @@ import logging, uuid
 from datetime import datetime, timezone, timedelta
 
 from flask import Blueprint, render_template, request, jsonify, url_for
-from flask_mail import Message
 
-from src.extensions import limiter, mongo, serializer, mail, bcrypt
-from src.blueprints.auth.auth_utils import validate_email, rate_limit_exceeded, validate_password
+from src.extensions import limiter, serializer, password_hasher
+from src.user_repository import user_repository
+from src.blueprints.auth.auth_utils import validate_email, rate_limit_exceeded, validate_password, invalidate_user
 from src.localization import get_locale
-from src import config
 
 password_reset_bp = Blueprint('password_reset', __name__)
 
@@ -26,28 +25,23 @@ def forgot_password_post():
     if not email or not isinstance(email, str) or not validate_email(email):
         return jsonify({'success': False, 'message': 'Valid email is required.'}), 400
     
-    user = mongo.db.users.find_one({'email': email})
-    
-    if user:
+    if user_repository.email_exists(email):
+        #Celery is only imported once the first email goes out
+        from src.tasks import queue_email
+
         token = serializer.dumps(email, salt='password-reset-salt')
         reset_url = url_for('auth.password_reset.reset_password', token=token, _external=True)
         
-        html = render_template('emails/reset-password.html', reset_url=reset_url)
-        
-        msg = Message('Reset Your Password',
-                      sender=config.MAIL_DEFAULT_SENDER,
-                      recipients=[email])
-        msg.html = html
-        
-        mail.send(msg)
-        
-        mongo.db.users.update_one(
-            {'email': email},
+        #Stored before the email is queued, a worker can send it before this request finishes
+        user_repository.update_by_email(
+            email,
             {'$set': {
                 'security.password_reset_token': token,
                 'security.password_reset_token_expires': datetime.now(tz=timezone.utc) + timedelta(hours=1)
             }}
         )
+        
+        queue_email('Reset Your Password', [email], 'emails/reset-password.html', reset_url=reset_url)
     
     # Always return a success message to prevent user enumeration
     return jsonify({'success': True, 'message': 'A password reset email has been sent.'}), 200
@@ -60,7 +54,7 @@ def reset_password(token):
     except:
         return render_template('pages/auth/reset-password-error.html', locale=get_locale())
 
-    user = mongo.db.users.find_one({'email': email})
+    user = user_repository.find_password_reset_state(email)
     if not user or user['security']['password_reset_token'] != token:
         return render_template('pages/auth/reset-password-error.html', locale=get_locale())
 
@@ -91,17 +85,17 @@ def reset_password_post():
     except:
         return jsonify({'success': False, 'message': 'Your password reset link has expired or is invalid. Please request a new one.'}), 400
 
-    user = mongo.db.users.find_one({'email': email})
+    user = user_repository.find_password_reset_state(email)
     if not user or user['security']['password_reset_token'] != token:
         return jsonify({'success': False, 'message': 'Your password reset link has expired or is invalid. Please request a new one.'}), 400
 
 
 
-    hashed_password = bcrypt.generate_password_hash(password).decode('utf-8')
+    hashed_password = password_hasher.generate_password_hash(password)
     alternate_id = str(uuid.uuid4())
     
-    mongo.db.users.update_one(
-        {'email': email},
+    user_repository.update_by_email(
+        email,
         {
             '$set': {
                 'password': hashed_password,
@@ -114,5 +108,7 @@ def reset_password_post():
             }
         }
     )
+    #The old alternative_id must stop resolving to a session user right away
+    invalidate_user(user['alternative_id'])
 
     return jsonify({'success': True, 'message': 'Your password has been successfully reset. You can now log in with your new password.'}), 200
@@ -1,31 +1,25 @@
 import logging
 
 from flask import Blueprint, render_template, request, jsonify, url_for
-from flask_mail import Message
 
-from src.extensions import limiter, mongo, serializer, mail
-from src.blueprints.auth.auth_utils import validate_email, rate_limit_exceeded
+from src.extensions import limiter, serializer
+from src.user_repository import user_repository
+from src.blueprints.auth.auth_utils import validate_email, rate_limit_exceeded, invalidate_user
 from src.localization import get_locale
-from src import config
 
 verify_email_bp = Blueprint('verify_email', __name__)
 
 
 def send_verification_email(user_email):
-    logging.info(f"Sending verification email to {user_email}")
+    #Celery is only imported once the first email goes out
+    from src.tasks import queue_email
+
+    logging.info("Sending verification email to %s", user_email)
     token = serializer.dumps(user_email, salt='email-verify-salt')
     
     verify_url = url_for('auth.verify_email.verify_email', token=token, _external=True)
     
-    html = render_template('emails/verify-email.html', verification_url=verify_url)
-    
-    msg = Message('Verify Your Email',
-                  sender=config.MAIL_DEFAULT_SENDER,
-                  recipients=[user_email])
-    
-    msg.html = html
-    
-    mail.send(msg)
+    queue_email('Verify Your Email', [user_email], 'emails/verify-email.html', verification_url=verify_url)
 
 @verify_email_bp.route('/verify-email')
 def verify_email_page():
@@ -34,7 +28,7 @@ def verify_email_page():
     if not email:
         return render_template('pages/auth/verify-email.html', locale=get_locale())
     
-    user = mongo.db.users.find_one({'email': email})
+    user = user_repository.find_verification_state(email)
     if user:
         if user['email_verified']:
             return render_template('pages/auth/email-verified.html', locale=get_locale(), success=True)
@@ -50,9 +44,10 @@ def verify_email(token):
     except:
         return render_template('pages/auth/email-verified.html', locale=get_locale(), success=False)
     
-    user = mongo.db.users.find_one({'email': email})
+    user = user_repository.find_verification_state(email)
     if user:
-        mongo.db.users.update_one({'email': email}, {'$set': {'email_verified': True}})
+        user_repository.update_by_email(email, {'$set': {'email_verified': True}})
+        invalidate_user(user['alternative_id'])
         return render_template('pages/auth/email-verified.html', locale=get_locale(), success=True)
     else:
         return render_template('pages/auth/email-verified.html', locale=get_locale(), success=False)
@@ -67,13 +62,13 @@ def resend_verification_email():
         return jsonify({'success': False, 'message': 'Valid email is required.'}), 400
     
     
-    user = mongo.db.users.find_one({'email': email})
+    user = user_repository.find_verification_state(email)
     
     if not user:
         return jsonify({'success': False, 'message': 'User with that email does not exist.'}), 400
     
     if user['email_verified'] == False:
-        mongo.db.users.update_one({'email': email}, {'$inc': {'usage_stats.total_verification_emails_sent': 1}})
+        user_repository.update_by_email(email, {'$inc': {'usage_stats.total_verification_emails_sent': 1}})
         
         send_verification_email(email)
         return jsonify({'success': True, 'message': 'Verification email sent. Please check your inbox.'}), 200
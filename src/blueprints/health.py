@@ -0,0 +1,47 @@
+import hmac, os, time
+
+import pymongo
+from flask import Blueprint, jsonify, request, Response
+
+from src import config
+from src.extensions import mongo, limiter, metrics
+
+health = Blueprint('health', __name__)
+
+#Set by the pre-fork worker when it's shutting down, load balancers should stop sending traffic
+health_state = {
+    'draining': False,
+    'started_at': time.time()
+}
+
+
+@health.route('/health')
+@limiter.exempt
+def liveness():
+    return jsonify({'status': 'ok', 'pid': os.getpid(), 'uptime': round(time.time() - health_state['started_at'])})
+
+@health.route('/ready')
+@limiter.exempt
+def readiness():
+    if health_state['draining']:
+        return jsonify({'status': 'draining', 'pid': os.getpid()}), 503
+
+    try:
+        with pymongo.timeout(2):
+            mongo.db.command('ping')
+    except pymongo.errors.PyMongoError:
+        return jsonify({'status': 'unavailable', 'pid': os.getpid(), 'mongo': False}), 503
+
+    return jsonify({'status': 'ready', 'pid': os.getpid(), 'mongo': True})
+
+
+@health.route('/metrics')
+@limiter.exempt
+def prometheus_metrics():
+    #Disabled unless a token is configured, scrapers send it as a bearer token
+    if not config.METRICS_TOKEN:
+        return jsonify({'status': 'disabled'}), 404
+    if not hmac.compare_digest(request.headers.get('Authorization', ''), f'Bearer {config.METRICS_TOKEN}'):
+        return jsonify({'status': 'unauthorized'}), 401
+
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
@@ -1,5 +1,6 @@
 from flask import Blueprint, render_template, request, send_from_directory
 from src.localization import get_locale
+from src.extensions import page_cache
 
 pages = Blueprint('pages', __name__)
 
@@ -10,29 +11,36 @@ def static_from_root():
     return send_from_directory("static/", request.path[1:])
 
 @pages.route('/')
+@page_cache.cached
 def home():
     return render_template('pages/home.html', locale=get_locale())
 
 @pages.route('/about')
+@page_cache.cached
 def about():
     return render_template('pages/about.html', locale=get_locale())
 
 @pages.route('/explore')
+@page_cache.cached
 def explore():
     return render_template('pages/explore.html', locale=get_locale())
 
 @pages.route('/documentation')
+@page_cache.cached
 def documentation():
     return render_template('pages/documentation.html', locale=get_locale())
 
 @pages.route('/contact')
+@page_cache.cached
 def contact():
     return render_template('pages/contact.html', locale=get_locale())
 
 @pages.route('/privacy-policy')
+@page_cache.cached
 def privacy_policy():
     return render_template('pages/privacy-policy.html', locale=get_locale())
 
 @pages.route('/terms-and-conditions')
+@page_cache.cached
 def terms_and_conditions():
     return render_template('pages/terms-and-conditions.html', locale=get_locale())
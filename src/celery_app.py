@@ -0,0 +1,43 @@
+import threading
+
+from flask import Flask
+
+from src import config
+
+
+_lock = threading.Lock()
+
+
+def make_celery(app: Flask):
+    #Imported here, Celery adds ~100ms to startup and isn't needed until the first task is queued
+    from celery import Celery, Task
+
+    class FlaskTask(Task):
+        def __call__(self, *args: object, **kwargs: object) -> object:
+            with app.app_context():
+                return self.run(*args, **kwargs)
+            
+    celery_app = Celery(
+        app.name,
+        backend=config.CELERY_RESULT_BACKEND,
+        broker=config.CELERY_BROKER_URL
+    )
+    
+    celery_app.Task = FlaskTask
+    celery_app.conf.update(
+        task_always_eager=config.CELERY_TASK_ALWAYS_EAGER,
+        task_eager_propagates=True
+    )
+    celery_app.set_default()
+    app.extensions['celery'] = celery_app
+    
+    return celery_app
+
+
+def ensure_celery(app: Flask):
+    """The app's Celery instance, created on first use when it wasn't set up in create_app()."""
+    if 'celery' not in app.extensions:
+        with _lock:
+            if 'celery' not in app.extensions:
+                make_celery(app)
+    return app.extensions['celery']
@@ -0,0 +1,11 @@
+from src.cli.db import db_cli
+from src.cli.assets import assets_cli
+from src.cli.profile import profile_cli
+from src.cli.templates import templates_cli
+
+
+def init_cli(app):
+    app.cli.add_command(db_cli)
+    app.cli.add_command(assets_cli)
+    app.cli.add_command(profile_cli)
+    app.cli.add_command(templates_cli)
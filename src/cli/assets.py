@@ -0,0 +1,13 @@
+import click
+from flask.cli import AppGroup
+
+from src import assets
+
+assets_cli = AppGroup('assets', help='Static asset commands.')
+
+
+@assets_cli.command('build')
+def build():
+    """Write content-hashed, precompressed static assets and their manifest."""
+    manifest = assets.build()
+    click.echo(f"Built {len(manifest)} static assets, manifest written to {assets.MANIFEST_FILE}")
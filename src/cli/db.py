@@ -0,0 +1,23 @@
+import click
+from flask.cli import AppGroup
+
+from src.user_repository import user_repository
+
+db_cli = AppGroup('db', help='Database maintenance commands.')
+
+
+@db_cli.command('ensure-indexes')
+def ensure_indexes():
+    """Create the indexes required by the user repository."""
+    created = user_repository.ensure_indexes()
+    click.echo(f"Ensured indexes: {', '.join(created)}")
+
+
+@db_cli.command('verify-indexes')
+def verify_indexes():
+    """Explain every user repository query and fail on collection scans."""
+    try:
+        user_repository.verify_indexes()
+    except RuntimeError as e:
+        raise click.ClickException(str(e))
+    click.echo("All users queries are covered by an index.")
@@ -0,0 +1,49 @@
+import os, subprocess, sys
+from collections import defaultdict
+
+import click
+from flask.cli import AppGroup
+
+profile_cli = AppGroup('profile', help='Performance profiling commands.')
+
+
+def parse_importtime(output):
+    """(module, self µs, cumulative µs) for every line of `python -X importtime` output."""
+    modules = []
+    for line in output.splitlines():
+        if not line.startswith('import time:') or 'imported package' in line:
+            continue
+        self_time, cumulative, name = line[len('import time:'):].split('|')
+        modules.append((name.strip(), int(self_time), int(cumulative)))
+    return modules
+
+
+@profile_cli.command('imports', with_appcontext=False)
+@click.option('--module', default='server', show_default=True, help='Module to import.')
+@click.option('--top', default=25, show_default=True, help='Number of modules and packages to show.')
+@click.option('--production/--development', default=None, help='Override PRODUCTION for the import.')
+def imports(module, top, production):
+    """Import a module in a fresh interpreter and report where the import time goes."""
+    environment = dict(os.environ)
+    if production is not None:
+        environment['PRODUCTION'] = 'true' if production else 'false'
+
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {module}'], env=environment, capture_output=True, text=True)
+    if result.returncode != 0:
+        raise click.ClickException(f"Importing {module} failed:\n{result.stderr[-2000:]}")
+
+    modules = parse_importtime(result.stderr)
+    total = next((cumulative for name, _, cumulative in modules if name == module), sum(self_time for _, self_time, _ in modules))
+
+    packages = defaultdict(int)
+    for name, self_time, _ in modules:
+        packages[name.split('.')[0]] += self_time
+
+    click.echo(f"import {module}: {total / 1000:.1f}ms, {len(modules)} modules\n")
+    click.echo(f"{'cumulative ms':>13}  {'self ms':>8}  module")
+    for name, self_time, cumulative in sorted(modules, key=lambda module: module[2], reverse=True)[:top]:
+        click.echo(f"{cumulative / 1000:>13.1f}  {self_time / 1000:>8.1f}  {name}")
+
+    click.echo(f"\n{'self ms':>13}  {'share':>8}  package (own modules only)")
+    for name, self_time in sorted(packages.items(), key=lambda package: package[1], reverse=True)[:top]:
+        click.echo(f"{self_time / 1000:>13.1f}  {self_time / total:>8.1%}  {name}")
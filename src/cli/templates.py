@@ -0,0 +1,14 @@
+import click
+from flask import current_app
+from flask.cli import AppGroup
+
+from src.extensions import template_cache
+
+templates_cli = AppGroup('templates', help='Template commands.')
+
+
+@templates_cli.command('precompile')
+def precompile():
+    """Compile every template into the template cache, so new workers don't compile on their first requests."""
+    names = template_cache.precompile(current_app)
+    click.echo(f"Precompiled {len(names)} templates into {template_cache.directory}")
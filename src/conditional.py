@@ -0,0 +1,75 @@
+#Conditional GET: strong ETags for HTML responses and 304 Not Modified for If-None-Match / If-Modified-Since.
+#ETags name the uncompressed body, a compressed representation gets the encoding appended ("<tag>:gzip", the format
+#Flask-Compress uses), so a tag the client got with any encoding it still accepts revalidates the same body.
+import hashlib
+
+from flask import g, request, Response
+
+
+def split_etag(etag):
+    base, _, encoding = etag.partition(':')
+    return base, encoding
+
+
+def matching_etag(etag):
+    """The tag from If-None-Match that is a representation of `etag`, None if the client has none."""
+    if_none_match = request.if_none_match
+    if not if_none_match:
+        return None
+
+    base = split_etag(etag)[0]
+    if if_none_match.star_tag:
+        return etag
+    #If-None-Match uses the weak comparison
+    for tag in if_none_match.as_set(include_weak=True):
+        tag_base, encoding = split_etag(tag)
+        if tag_base == base and (not encoding or request.accept_encodings[encoding]):
+            return tag
+    return None
+
+
+def is_not_modified(etag, last_modified=None):
+    if etag is not None and matching_etag(etag) is not None:
+        return True
+    #If-Modified-Since only counts without If-None-Match
+    return not request.if_none_match and request.if_modified_since is not None \
+        and last_modified is not None and last_modified <= request.if_modified_since
+
+
+def not_modified(response=None, etag=None):
+    """Turn a response (or a new empty one) into a 304, the body isn't sent and entity headers are dropped."""
+    if response is None:
+        response = Response()
+    response.status_code = 304
+    if etag is not None:
+        response.set_etag(matching_etag(etag) or etag)
+    #Nothing to minify or compress
+    g.skip_minify = True
+    return response
+
+
+class ConditionalRequests():
+    """Adds an ETag (SHA-1 of the body) to HTML responses and answers revalidations with a 304.
+
+    Must see the final body, so its after_request hook is registered before Minify's and after Compress's:
+    a 304 is never compressed, and ETags Compress suffixed (static files without a precompressed copy) still match.
+    Responses that already have an ETag (send_file, page cache) are only checked, not hashed.
+    """
+
+    def init_app(self, app):
+        app.after_request(self.check)
+
+    def check(self, response):
+        if request.method not in ('GET', 'HEAD') or response.status_code != 200:
+            return response
+
+        etag = response.get_etag()[0]
+        if etag is None:
+            if response.mimetype != 'text/html' or response.is_streamed or response.direct_passthrough:
+                return response
+            etag = hashlib.sha1(response.get_data()).hexdigest()
+            response.set_etag(etag)
+
+        if is_not_modified(etag, response.last_modified):
+            return not_modified(response, etag)
+        return response
@@ -1,11 +1,12 @@
+import time
+
+from flask import g
 from flask_limiter import Limiter
 from flask_limiter.util import get_remote_address
 
 from flask_pymongo import PyMongo
 from flask_bcrypt import Bcrypt
 from flask_seasurf import SeaSurf
-from flask_compress import Compress
-from flask_minify import Minify
 from flask_babel import Babel
 from flask_login import LoginManager
 from flask_talisman import Talisman
@@ -13,52 +14,130 @@ from flask_mail import Mail
 
 from src import config
 from src.localization import get_locale
+from src.password_hasher import PasswordHasher
+from src.smtp_pool import SMTPConnectionPool
+from src.page_cache import PageCache
+from src.assets import StaticAssets
+from src.template_minifier import TemplateMinifier
+from src.template_cache import TemplateCache
+from src.fragment_cache import FragmentCache
+from src.conditional import ConditionalRequests
+from src.translation_catalogs import TranslationCatalogs
+from src.metrics import Metrics
+import src.rate_limit_storage # registers the sharded-memory:// and hybrid+...:// storage schemes
 
 from itsdangerous import URLSafeTimedSerializer
 
 limiter = Limiter(
     get_remote_address,
-    storage_uri=config.MONGO_URI,
+    storage_uri=config.RATELIMIT_STORAGE_URI,
     strategy='fixed-window', # 'moving-window' when you want to prevent burst attacks
 )
 
 
 mongo = PyMongo()
 bcrypt = Bcrypt()
+password_hasher = PasswordHasher()
 seasurf = SeaSurf()
 mail = Mail()
+smtp_pool = SMTPConnectionPool()
 
 babel = Babel()
+translation_catalogs = TranslationCatalogs()
 talisman = Talisman()
 
+metrics = Metrics()
+page_cache = PageCache()
+static_assets = StaticAssets()
+template_minifier = TemplateMinifier()
+template_cache = TemplateCache()
+fragment_cache = FragmentCache()
+conditional_requests = ConditionalRequests()
+
 login_manager = LoginManager()
 login_manager.login_view = 'auth.login'
 login_manager.login_message = 'Please log in to access this page.'
 
 
 if config.PRODUCTION:
-    compress = Compress()
-    minify = Minify(html=True, js=True, cssless=True, go=False)
+    #Only needed in production, Flask-Minify pulls in htmlmin, jsmin, lesscpy and ply
+    from flask_compress import Compress
+    from flask_minify import Minify
+
+    class BypassableMinify(Minify):
+        #Skips responses that were minified ahead of time (page cache, built static assets, minified templates) or are already encoded
+        def main(self, response):
+            if g.get('skip_minify') or 'Content-Encoding' in response.headers:
+                return response
+            return super().main(response)
+
+    class TimedCompress(Compress):
+        def compress(self, app, response, algorithm):
+            start = time.perf_counter()
+            try:
+                return super().compress(app, response, algorithm)
+            finally:
+                metrics.compression_duration.observe(time.perf_counter() - start, algorithm)
+
+    compress = TimedCompress()
+    minify = BypassableMinify(html=True, js=True, cssless=True, go=False)
 
 
 
 serializer = URLSafeTimedSerializer(config.SERIALIZER_SECRET_KEY)
 
 
+def init_metrics(app):
+    #Imports src.extensions itself
+    from src.blueprints.auth.auth_utils import user_cache
+
+    metrics.init_app(app)
+
+    #Components that keep their own numbers
+    metrics.histogram('password_hash_duration_seconds', "bcrypt hash/check time per call, waiting for the pool included", ('operation',),
+                      children={('hash',): password_hasher.latency['hashes'], ('check',): password_hasher.latency['checks']})
+    metrics.counter('password_hash_rejected_total', "Hashes rejected because the pool was saturated", collect=lambda: {(): password_hasher.stats['rejected']})
+    metrics.histogram('smtp_send_duration_seconds', "SMTP transaction time per message", children={(): smtp_pool.send_latency})
+    metrics.counter('smtp_messages_total', "Emails handed to the SMTP server", ('result',),
+                    collect=lambda: {('sent',): smtp_pool.stats['sent'], ('failed',): smtp_pool.stats['failed']})
+    metrics.counter('template_cache_total', "Templates loaded from the bytecode cache or compiled", ('result',),
+                    collect=lambda: {(result,): count for result, count in template_cache.bytecode_cache.stats.items()} if template_cache.bytecode_cache else {})
+    metrics.counter('template_fragment_cache_total', "{% cache %} fragment lookups", ('result',),
+                    collect=lambda: {('hit',): fragment_cache.cache.hits, ('miss',): fragment_cache.cache.misses} if fragment_cache.cache else {})
+    metrics.counter('session_user_cache_total', "Session user lookups in load_user, served from the cache or read from MongoDB", ('result',),
+                    collect=lambda: {('hit',): user_cache.hits, ('miss',): user_cache.misses})
+
+
 def init_extensions(app):
+    #First, so its request hooks wrap everything else
+    init_metrics(app)
     limiter.init_app(app)
     
-    mongo.init_app(app)
+    mongo.init_app(app, event_listeners=[metrics.mongo_listener])
     bcrypt.init_app(app)
+    password_hasher.init_app(app)
     seasurf.init_app(app)
     mail.init_app(app)
+    smtp_pool.init_app(app)
     babel.init_app(app, locale_selector=get_locale)
+    translation_catalogs.init_app(app)
     login_manager.init_app(app)
     
     #You can enable force_https if you have a SSL certificate and everything set up
     #Also depends on your proxy setup
     talisman.init_app(app, force_https=config.FORCE_HTTPS, content_security_policy=config.CSP)
+    #Before anything loads a template
+    template_cache.init_app(app)
+    fragment_cache.init_app(app)
     
     if config.PRODUCTION:
+        static_assets.init_app(app)
+        template_minifier.init_app(app, template_cache)
         compress.init_app(app)
-        minify.init_app(app)
\ No newline at end of file
+        #Registered after Compress so it runs before it, a 304 isn't compressed and Compress's ETag suffixes still match
+        conditional_requests.init_app(app)
+        #Between Compress and Minify so it stores minified but uncompressed bodies
+        page_cache.init_app(app)
+        minify.init_app(app)
+    else:
+        conditional_requests.init_app(app)
\ No newline at end of file
@@ -0,0 +1,64 @@
+#{% cache %} tag for template parts that only depend on the locale, the auth state and a few values:
+#
+#   {% cache 'navbar', active_page %} ... {% endcache %}
+#
+#The rendered HTML is kept per (template, fragment, values, locale, logged in) in a bounded per-process cache.
+#Anything else the fragment shows (flashed messages, the user's name, CSRF tokens) must be passed as a value or stay outside of it.
+import uuid
+
+from flask import has_request_context
+from flask_login import current_user
+from jinja2 import nodes
+from jinja2.ext import Extension
+
+from src.cache import TTLCache
+
+
+class FragmentCacheExtension(Extension):
+    tags = {'cache'}
+
+    def __init__(self, environment):
+        super().__init__(environment)
+        #Caches nothing until FragmentCache.init_app sets the real one
+        environment.extend(fragment_cache=TTLCache(maxsize=0))
+
+    def parse(self, parser):
+        lineno = next(parser.stream).lineno
+
+        values = [parser.parse_expression()]
+        while parser.stream.skip_if('comma'):
+            values.append(parser.parse_expression())
+        body = parser.parse_statements(['name:endcache'], drop_needle=True)
+
+        #New on every parse, so a template that's edited and reloaded doesn't get its old fragments back
+        version = nodes.Const(f'{parser.name}:{uuid.uuid4().hex}')
+        return nodes.CallBlock(self.call_method('_render', [version, nodes.List(values)]), [], [], body).set_lineno(lineno)
+
+    def _render(self, version, values, caller):
+        if not has_request_context():
+            return caller()
+        #Not imported at the top, pybabel loads this extension to extract messages and src.config needs the environment
+        from src.localization import get_locale
+
+        key = (version, *values, get_locale(), current_user.is_authenticated)
+        cache = self.environment.fragment_cache
+        try:
+            fragment = cache.get(key)
+        except TypeError: # unhashable value
+            return caller()
+
+        if fragment is None:
+            fragment = caller()
+            cache.set(key, fragment)
+        return fragment
+
+
+class FragmentCache():
+    def __init__(self):
+        self.cache = None
+
+    def init_app(self, app):
+        #Registered even with a size of 0, the templates use the tag either way
+        self.cache = TTLCache(maxsize=app.config.get('FRAGMENT_CACHE_SIZE', 512), ttl=app.config.get('FRAGMENT_CACHE_TTL', 600))
+        app.jinja_env.add_extension(FragmentCacheExtension)
+        app.jinja_env.fragment_cache = self.cache
@@ -1,14 +1,35 @@
 from flask import request, session, g
-from src.config import ACCEPTED_LANGUAGES
+from werkzeug.datastructures import LanguageAccept
+from werkzeug.http import parse_accept_header
+from src.config import ACCEPTED_LANGUAGES, ACCEPT_LANGUAGE_CACHE_SIZE
+from src.cache import TTLCache
 from flask_login import current_user
 
 
+#Raw Accept-Language header -> best accepted language, browsers send only a handful of distinct headers
+accept_language_cache = TTLCache(maxsize=ACCEPT_LANGUAGE_CACHE_SIZE, ttl=None)
+_MISSING = object()
+
+
 def update_user_locale(locale):
     if current_user.is_authenticated:
         g.lang = locale
         g.set_user_locale = True
 
+def negotiate_language(header):
+    language = accept_language_cache.get(header, _MISSING)
+    if language is _MISSING:
+        language = parse_accept_header(header, LanguageAccept).best_match(ACCEPTED_LANGUAGES)
+        accept_language_cache.set(header, language)
+    return language
+
 def get_locale():
+    #Resolved once per request, Babel, the page cache and every render_template ask for it
+    if 'locale' not in g:
+        g.locale = resolve_locale()
+    return g.locale
+
+def resolve_locale():
     lang = request.args.get('lang')
     
     g.set_lang_cookie = False
@@ -24,4 +45,4 @@ def get_locale():
         if request.cookies['lang'] in ACCEPTED_LANGUAGES:
             update_user_locale(request.cookies['lang'])           
             return request.cookies['lang']
-    return request.accept_languages.best_match(ACCEPTED_LANGUAGES)
\ No newline at end of file
+    return negotiate_language(request.headers.get('Accept-Language', ''))
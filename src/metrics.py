@@ -0,0 +1,214 @@
+import os, threading, time
+
+from flask import g, request, before_render_template, template_rendered
+from pymongo import monitoring
+
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+#Mongo commands and compression are mostly sub-millisecond
+FAST_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1)
+
+
+class Histogram():
+    """Cumulative latency histogram (in seconds) with Prometheus-style buckets."""
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1) # last one is +Inf
+        self.count = 0
+        self.sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        with self._lock:
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    self.counts[i] += 1
+                    break
+            else:
+                self.counts[-1] += 1
+
+            self.count += 1
+            self.sum += value
+
+    def snapshot(self):
+        with self._lock:
+            cumulative, total = [], 0
+            for bound, count in zip(self.buckets + (float('inf'),), self.counts):
+                total += count
+                cumulative.append((bound, total))
+
+            return {'buckets': cumulative, 'count': self.count, 'sum': self.sum}
+
+
+class Family():
+    """A named metric with labels, children are created on first use."""
+
+    def __init__(self, kind, name, help, labels=(), buckets=DEFAULT_BUCKETS, children=None, collect=None):
+        self.kind = kind
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.buckets = buckets
+        self.children = dict(children or {})
+        #Callback returning {label values: value}, for numbers owned by another component
+        self.collect = collect
+        self._lock = threading.Lock()
+
+    def child(self, *values):
+        child = self.children.get(values)
+        if child is None:
+            with self._lock:
+                child = self.children.setdefault(values, Histogram(self.buckets) if self.kind == 'histogram' else [0])
+        return child
+
+    def observe(self, value, *values):
+        self.child(*values).observe(value)
+
+    def inc(self, *values, amount=1):
+        counter = self.child(*values)
+        with self._lock:
+            counter[0] += amount
+
+    def samples(self):
+        if self.collect is not None:
+            return list(self.collect().items())
+        return list(self.children.items())
+
+
+def _format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in pairs)
+    return '{' + ','.join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + '}'
+
+
+def _format_bound(bound):
+    return '+Inf' if bound == float('inf') else repr(float(bound))
+
+
+class MongoCommandListener(monitoring.CommandListener):
+    """pymongo command monitoring: count and latency per command name."""
+
+    def __init__(self, duration, failures):
+        self.duration = duration
+        self.failures = failures
+
+    def started(self, event):
+        pass
+
+    def succeeded(self, event):
+        self.duration.observe(event.duration_micros / 1e6, event.command_name)
+
+    def failed(self, event):
+        self.duration.observe(event.duration_micros / 1e6, event.command_name)
+        self.failures.inc(event.command_name)
+
+
+class Metrics():
+    """In-process request, MongoDB, template and compression metrics in the Prometheus text format.
+
+    Every process keeps its own numbers, with several pre-fork workers a scrape of /metrics
+    reaches one of them (the `pid` in the process_info metric tells which).
+    """
+
+    def __init__(self):
+        self.families = {}
+        self.in_flight = 0
+        self._in_flight_lock = threading.Lock()
+        self.task_dispatcher = None
+        self.started_at = time.time()
+
+        self.request_duration = self.histogram('http_request_duration_seconds', "Time spent handling a request, after_request handlers included", ('endpoint', 'method'))
+        self.requests = self.counter('http_requests_total', "Finished requests", ('endpoint', 'method', 'status'))
+        self.gauge('http_requests_in_flight', "Requests being handled right now", collect=lambda: {(): self.in_flight})
+        self.gauge('waitress_queue_depth', "Requests waiting for a free waitress thread", collect=self._waitress_queue_depth)
+        self.gauge('waitress_active_threads', "Waitress threads busy with a request", collect=self._waitress_active_threads)
+
+        self.mongo_duration = self.histogram('mongodb_command_duration_seconds', "MongoDB command round trips", ('command',), buckets=FAST_BUCKETS)
+        self.mongo_failures = self.counter('mongodb_command_failures_total', "MongoDB commands that failed", ('command',))
+        self.mongo_listener = MongoCommandListener(self.mongo_duration, self.mongo_failures)
+
+        self.template_duration = self.histogram('template_render_duration_seconds', "render_template calls, includes and layouts included", ('template',))
+        self.compression_duration = self.histogram('response_compression_duration_seconds', "Flask-Compress time per compressed response", ('algorithm',), buckets=FAST_BUCKETS)
+
+        self.gauge('process_info', "Process that answered this scrape", ('pid',), collect=lambda: {(str(os.getpid()),): 1})
+        self.gauge('process_uptime_seconds', "Seconds since the process started", collect=lambda: {(): round(time.time() - self.started_at, 1)})
+
+    def histogram(self, name, help, labels=(), buckets=DEFAULT_BUCKETS, children=None):
+        return self.families.setdefault(name, Family('histogram', name, help, labels, buckets, children))
+
+    def counter(self, name, help, labels=(), collect=None):
+        return self.families.setdefault(name, Family('counter', name, help, labels, collect=collect))
+
+    def gauge(self, name, help, labels=(), collect=None):
+        return self.families.setdefault(name, Family('gauge', name, help, labels, collect=collect))
+
+    def init_app(self, app):
+        #Registered before the other extensions, so the time spent in their before_request hooks counts too
+        app.before_request(self.start_request)
+        app.after_request(self.record_status)
+        app.teardown_request(self.finish_request)
+
+        before_render_template.connect(self.start_render, app)
+        template_rendered.connect(self.finish_render, app)
+
+    def watch_waitress(self, server):
+        self.task_dispatcher = server.task_dispatcher
+
+    def _waitress_queue_depth(self):
+        return {(): len(self.task_dispatcher.queue)} if self.task_dispatcher else {}
+
+    def _waitress_active_threads(self):
+        return {(): self.task_dispatcher.active_count} if self.task_dispatcher else {}
+
+    def start_request(self):
+        g.metrics_started_at = time.perf_counter()
+        with self._in_flight_lock:
+            self.in_flight += 1
+
+    def record_status(self, response):
+        g.metrics_status = response.status_code
+        return response
+
+    def finish_request(self, exc):
+        started_at = g.pop('metrics_started_at', None)
+        if started_at is None:
+            return
+
+        with self._in_flight_lock:
+            self.in_flight -= 1
+
+        #Unmatched URLs share one label, anything else would let clients create series at will
+        endpoint = request.url_rule.endpoint if request.url_rule else 'none'
+        self.request_duration.observe(time.perf_counter() - started_at, endpoint, request.method)
+        self.requests.inc(endpoint, request.method, str(g.get('metrics_status', 500)))
+
+    def start_render(self, sender, template, context, **extra):
+        g.setdefault('metrics_renders', []).append(time.perf_counter())
+
+    def finish_render(self, sender, template, context, **extra):
+        renders = g.get('metrics_renders')
+        if renders:
+            self.template_duration.observe(time.perf_counter() - renders.pop(), template.name or 'string')
+
+    def render(self):
+        lines = []
+        for family in self.families.values():
+            samples = family.samples()
+            if not samples:
+                continue
+
+            lines.append(f'# HELP {family.name} {family.help}')
+            lines.append(f'# TYPE {family.name} {family.kind}')
+            for values, value in samples:
+                if family.kind == 'histogram':
+                    snapshot = value.snapshot()
+                    for bound, count in snapshot['buckets']:
+                        lines.append(f"{family.name}_bucket{_format_labels(family.labels, values, [('le', _format_bound(bound))])} {count}")
+                    lines.append(f"{family.name}_sum{_format_labels(family.labels, values)} {snapshot['sum']}")
+                    lines.append(f"{family.name}_count{_format_labels(family.labels, values)} {snapshot['count']}")
+                else:
+                    lines.append(f"{family.name}{_format_labels(family.labels, values)} {value[0] if isinstance(value, list) else value}")
+        return '\n'.join(lines) + '\n'
@@ -0,0 +1,112 @@
+import gzip, hashlib, logging
+from datetime import datetime, timezone
+from functools import wraps
+
+import brotli
+import zstandard
+from flask import request, session, g, Response
+from flask_login import current_user
+
+from src.cache import TTLCache
+from src.conditional import is_not_modified, not_modified
+from src.localization import get_locale
+
+
+#Preferred encodings, best compression first
+ENCODINGS = ['br', 'zstd', 'gzip']
+
+
+def compress_body(body):
+    """Precompress a body once with every supported encoding."""
+    return {
+        'identity': body,
+        'br': brotli.compress(body, quality=11),
+        'zstd': zstandard.ZstdCompressor(level=19).compress(body),
+        'gzip': gzip.compress(body, compresslevel=9, mtime=0),
+    }
+
+
+def choose_encoding(bodies):
+    encoding = request.accept_encodings.best_match(ENCODINGS)
+    if encoding in bodies and encoding != 'identity':
+        return encoding
+    return 'identity'
+
+
+class PageCache():
+    """Caches fully rendered pages whose output only depends on endpoint, locale and auth state.
+
+    The body is captured after Flask-Minify and stored precompressed, so a cache hit skips
+    rendering, minification and compression, and a revalidation (If-None-Match/If-Modified-Since)
+    gets its 304 before any of that. Pages that embed a CSRF token or flashed messages are never stored.
+    """
+
+    def __init__(self):
+        self.cache = None
+
+    def init_app(self, app):
+        self.cache = TTLCache(maxsize=app.config.get('PAGE_CACHE_SIZE', 256), ttl=app.config.get('PAGE_CACHE_TTL', 300))
+        #Must be registered after Compress and before Minify, after_request handlers run in reverse order
+        app.after_request(self.store)
+
+    def cache_key(self):
+        return (request.endpoint, get_locale(), current_user.is_authenticated)
+
+    def cached(self, view):
+        @wraps(view)
+        def decorated_view(*args, **kwargs):
+            #Only plain page views are cacheable, ?lang= is already part of the key
+            if self.cache is None or any(arg != 'lang' for arg in request.args) or session.get('_flashes'):
+                return view(*args, **kwargs)
+
+            key = self.cache_key()
+            entry = self.cache.get(key)
+            if entry is not None:
+                #Revalidations are answered without building the response
+                if is_not_modified(entry['etag'], entry['last_modified']):
+                    return not_modified(etag=self.etag(entry, choose_encoding(entry['bodies'])))
+                return self.respond(entry)
+
+            g.page_cache_key = key
+            return view(*args, **kwargs)
+        return decorated_view
+
+    @staticmethod
+    def etag(entry, encoding):
+        #Same tags as an uncached render gets from ConditionalRequests and Flask-Compress
+        return entry['etag'] if encoding == 'identity' else f"{entry['etag']}:{encoding}"
+
+    def respond(self, entry):
+        g.skip_minify = True
+
+        encoding = choose_encoding(entry['bodies'])
+        response = Response(entry['bodies'][encoding], mimetype=entry['mimetype'])
+        if encoding != 'identity':
+            response.headers['Content-Encoding'] = encoding
+        response.headers['Vary'] = 'Accept-Encoding'
+        response.set_etag(self.etag(entry, encoding))
+        response.last_modified = entry['last_modified']
+        return response
+
+    def store(self, response):
+        key = g.pop('page_cache_key', None)
+        if key is None:
+            return response
+
+        if response.status_code != 200 or response.mimetype != 'text/html' or 'Content-Encoding' in response.headers \
+                or g.get('seasurf_csrf_token_requested') or response.direct_passthrough:
+            return response
+
+        body = response.get_data()
+        entry = {
+            'bodies': compress_body(body),
+            'etag': hashlib.sha1(body).hexdigest(),
+            'last_modified': datetime.now(timezone.utc).replace(microsecond=0),
+            'mimetype': response.mimetype
+        }
+        self.cache.set(key, entry)
+        #ConditionalRequests would hash the same body again
+        response.set_etag(entry['etag'])
+        response.last_modified = entry['last_modified']
+        logging.debug("Cached page %s", key)
+        return response
@@ -0,0 +1,133 @@
+import hashlib, hmac, logging, multiprocessing, os, threading, time
+from concurrent.futures import ProcessPoolExecutor, TimeoutError
+from concurrent.futures.process import BrokenProcessPool
+
+import bcrypt
+from flask import g
+
+from src.metrics import Histogram
+
+
+class PasswordHasherSaturated(Exception):
+    """Raised when the hashing pool queue is full (or a hash took too long), handled as a 503."""
+
+
+#These run inside the pool processes, they mirror Flask-Bcrypt so existing hashes stay valid
+def _prepare_password(password, handle_long_passwords):
+    password = password.encode('utf-8')
+    if handle_long_passwords:
+        password = hashlib.sha256(password).hexdigest().encode('utf-8')
+    return password
+
+def _generate_password_hash(password, rounds, prefix, handle_long_passwords):
+    salt = bcrypt.gensalt(rounds=rounds, prefix=prefix.encode('utf-8'))
+    return bcrypt.hashpw(_prepare_password(password, handle_long_passwords), salt).decode('utf-8')
+
+def _check_password_hash(pw_hash, password, handle_long_passwords):
+    pw_hash = pw_hash.encode('utf-8')
+    return hmac.compare_digest(bcrypt.hashpw(_prepare_password(password, handle_long_passwords), pw_hash), pw_hash)
+
+
+class PasswordHasher():
+    """Runs bcrypt in a dedicated process pool so request threads never spend their time hashing.
+
+    At most `workers + queue_depth` hashes can be in flight, anything beyond that is
+    rejected straight away with PasswordHasherSaturated instead of piling up on the
+    waitress threads.
+    """
+
+    def __init__(self):
+        self._executor = None
+        self._executor_pid = None
+        self._lock = threading.Lock()
+
+        self.stats = {
+            'hashes': 0,
+            'checks': 0,
+            'rejected': 0,
+            'total_time': 0.0
+        }
+        #Time a request waits for bcrypt, queueing in the pool included
+        self.latency = {'hashes': Histogram(), 'checks': Histogram()}
+
+    def init_app(self, app):
+        self.rounds = app.config.get('BCRYPT_LOG_ROUNDS', 12)
+        self.prefix = app.config.get('BCRYPT_HASH_PREFIX', '2b')
+        self.handle_long_passwords = app.config.get('BCRYPT_HANDLE_LONG_PASSWORDS', False)
+
+        self.workers = app.config.get('PASSWORD_HASH_WORKERS') or os.cpu_count() or 1
+        self.queue_depth = app.config.get('PASSWORD_HASH_QUEUE_DEPTH', 16)
+        self.timeout = app.config.get('PASSWORD_HASH_TIMEOUT', 10)
+
+        self._slots = threading.BoundedSemaphore(self.workers + self.queue_depth)
+
+    @property
+    def executor(self):
+        #Created lazily and per process, a pool inherited through fork is unusable
+        if self._executor is None or self._executor_pid != os.getpid():
+            with self._lock:
+                if self._executor is None or self._executor_pid != os.getpid():
+                    method = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+                    self._executor = ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context(method))
+                    self._executor_pid = os.getpid()
+        return self._executor
+
+    def _reset_executor(self, executor):
+        #A pool process died (e.g. killed for memory), the pool rejects everything from then on
+        with self._lock:
+            if self._executor is executor:
+                logging.error("Password hashing pool is broken, starting a new one")
+                executor.shutdown(wait=False, cancel_futures=True)
+                self._executor = None
+
+    def _submit(self, executor, fn, *args):
+        if not self._slots.acquire(blocking=False):
+            self.stats['rejected'] += 1
+            logging.warning("Password hashing pool is saturated, rejecting request")
+            raise PasswordHasherSaturated()
+
+        try:
+            future = executor.submit(fn, *args)
+        except BaseException:
+            self._slots.release()
+            raise
+        #The slot is freed when the job is done or cancelled, not when the request stops waiting for it
+        future.add_done_callback(lambda future: self._slots.release())
+        return future
+
+    def _run(self, stat, fn, *args):
+        start = time.perf_counter()
+        for attempt in (1, 2):
+            executor = self.executor
+            try:
+                future = self._submit(executor, fn, *args)
+                result = future.result(timeout=self.timeout)
+                break
+            except BrokenProcessPool:
+                self._reset_executor(executor)
+                if attempt == 2:
+                    raise
+            except TimeoutError:
+                #Still queued jobs are dropped, one that's already running keeps its slot until it's done
+                future.cancel()
+                self.stats['rejected'] += 1
+                logging.warning("Password hashing took longer than %ss, rejecting request", self.timeout)
+                raise PasswordHasherSaturated()
+
+        elapsed = time.perf_counter() - start
+        self.stats[stat] += 1
+        self.stats['total_time'] += elapsed
+        self.latency[stat].observe(elapsed)
+        g.password_hash_time = g.get('password_hash_time', 0.0) + elapsed
+        return result
+
+    def generate_password_hash(self, password):
+        return self._run('hashes', _generate_password_hash, password, self.rounds, self.prefix, self.handle_long_passwords)
+
+    def check_password_hash(self, pw_hash, password):
+        return self._run('checks', _check_password_hash, pw_hash, password, self.handle_long_passwords)
+
+    def shutdown(self):
+        if self._executor is not None and self._executor_pid == os.getpid():
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
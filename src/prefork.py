@@ -0,0 +1,251 @@
+#Pre-fork launcher for production: one listening socket, N worker processes each running their own
+#create_app() + waitress, so Python work is spread over all cores instead of sharing one GIL.
+#
+#  SIGTERM / SIGINT   graceful shutdown: workers stop accepting, finish in-flight requests and exit
+#  SIGHUP             rolling restart: a new worker is started (and ready) before an old one is stopped
+#  SIGTTIN / SIGTTOU  add / remove a worker
+#
+#Workers are forked before the app exists, so nothing is shared between them: every worker creates
+#its own MongoDB client, SMTP pool, caches and bcrypt pool after the fork. Only their log records go
+#through the master, which is the one process writing (and rotating) app.log.
+import logging, os, select, signal, socket, sys, time
+
+from src import config
+from src.structured_logging import LogReceiver, queue_handler
+
+
+class Worker():
+    def __init__(self, pid, ready_fd):
+        self.pid = pid
+        self.ready_fd = ready_fd
+        self.ready = False
+        self.started_at = time.monotonic()
+        self.stopping_since = None
+
+
+class Arbiter():
+    """Master process: owns the listening socket, forks the workers and keeps their number up."""
+
+    def __init__(self, host=config.HOST, port=config.PORT, workers=config.WEB_WORKERS, threads=config.WAITRESS_THREADS):
+        self.host = host
+        self.port = int(port)
+        self.worker_count = workers
+        self.threads = threads
+        self.graceful_timeout = config.WEB_GRACEFUL_TIMEOUT
+        self.boot_timeout = config.WEB_BOOT_TIMEOUT
+
+        self.workers = {}
+        self.signals = []
+        self.stopping = False
+        self.crashes = []
+        self.log_receiver = None
+
+    def run(self):
+        self.socket = socket.create_server((self.host, self.port), backlog=2048)
+        #Only the master writes (and rotates) the log file
+        handler = queue_handler()
+        if handler is not None:
+            self.log_receiver = LogReceiver(handler)
+        logging.info("Pre-fork master %d listening on http://%s:%d with %d workers", os.getpid(), self.host, self.port, self.worker_count)
+
+        for sig in (signal.SIGTERM, signal.SIGINT, signal.SIGHUP, signal.SIGTTIN, signal.SIGTTOU):
+            signal.signal(sig, lambda signum, frame: self.signals.append(signum))
+
+        self.manage_workers()
+        while self.workers or not self.stopping:
+            self.handle_signals()
+            self.check_readiness()
+            self.reap_workers()
+            self.kill_stuck_workers()
+            if not self.stopping:
+                self.manage_workers()
+            time.sleep(0.2)
+
+        self.socket.close()
+        if self.log_receiver is not None:
+            self.log_receiver.close()
+        logging.info("Pre-fork master stopped")
+
+    def handle_signals(self):
+        while self.signals:
+            signum = self.signals.pop(0)
+            if signum in (signal.SIGTERM, signal.SIGINT):
+                if not self.stopping:
+                    logging.info("Shutting down workers")
+                    self.stopping = True
+                    for worker in list(self.workers.values()):
+                        self.stop_worker(worker)
+            elif signum == signal.SIGHUP:
+                self.rolling_restart()
+            elif signum == signal.SIGTTIN:
+                self.worker_count += 1
+            elif signum == signal.SIGTTOU and self.worker_count > 1:
+                self.worker_count -= 1
+
+    def running_workers(self):
+        return [worker for worker in self.workers.values() if worker.stopping_since is None]
+
+    def manage_workers(self):
+        running = self.running_workers()
+        while len(running) < self.worker_count:
+            running.append(self.spawn_worker())
+
+        #Too many after SIGTTOU, stop the oldest ones
+        for worker in sorted(running, key=lambda worker: worker.started_at)[:len(running) - self.worker_count]:
+            self.stop_worker(worker)
+
+    def spawn_worker(self):
+        ready_read, ready_write = os.pipe()
+        pid = os.fork()
+        if pid == 0:
+            if self.log_receiver is not None:
+                self.log_receiver.forward()
+            os.close(ready_read)
+            for worker in self.workers.values():
+                os.close(worker.ready_fd)
+            code = 0
+            try:
+                run_worker(self.socket, ready_write, self.threads, self.worker_count, self.graceful_timeout)
+            except SystemExit as e:
+                code = e.code or 0
+            except BaseException:
+                logging.exception("Worker crashed")
+                code = 1
+            finally:
+                logging.shutdown()
+                os._exit(code)
+
+        os.close(ready_write)
+        worker = Worker(pid, ready_read)
+        self.workers[pid] = worker
+        logging.info("Started worker %d", pid)
+        return worker
+
+    def stop_worker(self, worker):
+        if worker.stopping_since is None:
+            worker.stopping_since = time.monotonic()
+            try:
+                os.kill(worker.pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    def check_readiness(self):
+        pending = [worker for worker in self.workers.values() if not worker.ready]
+        if not pending:
+            return
+
+        readable, _, _ = select.select([worker.ready_fd for worker in pending], [], [], 0)
+        for worker in pending:
+            if worker.ready_fd in readable:
+                worker.ready = os.read(worker.ready_fd, 1) == b'1'
+                if worker.ready:
+                    logging.info("Worker %d is ready", worker.pid)
+            elif worker.stopping_since is None and time.monotonic() - worker.started_at > self.boot_timeout:
+                logging.error("Worker %d did not become ready within %ss, stopping it", worker.pid, self.boot_timeout)
+                self.stop_worker(worker)
+
+    def reap_workers(self):
+        while True:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                return
+            if pid == 0:
+                return
+
+            worker = self.workers.pop(pid, None)
+            if worker is None:
+                continue
+            os.close(worker.ready_fd)
+
+            code = os.waitstatus_to_exitcode(status)
+            if worker.stopping_since is not None:
+                logging.info("Worker %d stopped", pid)
+                continue
+
+            logging.error("Worker %d exited unexpectedly with code %s", pid, code)
+            #A worker that keeps dying (e.g. can't reach MongoDB on boot) shouldn't turn into a fork loop
+            now = time.monotonic()
+            self.crashes = [crashed_at for crashed_at in self.crashes if now - crashed_at < 60] + [now]
+            if len(self.crashes) > self.worker_count * 3:
+                logging.critical("Workers keep crashing, shutting down")
+                self.signals.append(signal.SIGTERM)
+            else:
+                time.sleep(min(len(self.crashes), 5))
+
+    def kill_stuck_workers(self):
+        for worker in self.workers.values():
+            if worker.stopping_since is not None and time.monotonic() - worker.stopping_since > self.graceful_timeout + 5:
+                logging.warning("Worker %d did not stop in time, killing it", worker.pid)
+                try:
+                    os.kill(worker.pid, signal.SIGKILL)
+                except ProcessLookupError:
+                    pass
+
+    def rolling_restart(self):
+        logging.info("Restarting workers")
+        for old in sorted(self.running_workers(), key=lambda worker: worker.started_at):
+            new = self.spawn_worker()
+            deadline = time.monotonic() + self.boot_timeout
+            while not new.ready and new.pid in self.workers and time.monotonic() < deadline:
+                self.check_readiness()
+                self.reap_workers()
+                time.sleep(0.1)
+
+            if not new.ready:
+                #Keep the old workers serving
+                logging.error("New worker did not become ready, aborting the restart")
+                self.stop_worker(new)
+                return
+            self.stop_worker(old)
+
+
+def run_worker(listener, ready_fd, threads, worker_count, graceful_timeout):
+    for sig in (signal.SIGINT, signal.SIGHUP, signal.SIGTTIN, signal.SIGTTOU):
+        signal.signal(sig, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+
+    #Every worker gets its own bcrypt pool, share the cores between them
+    if config.PASSWORD_HASH_WORKERS:
+        config.PASSWORD_HASH_WORKERS = max(1, config.PASSWORD_HASH_WORKERS // worker_count)
+
+    from waitress.channel import HTTPChannel
+    from waitress.server import create_server
+    from server import create_app
+    from src.blueprints.health import health_state
+    from src.extensions import metrics
+    from src.user_repository import user_repository
+
+    app = create_app()
+    server = create_server(app, sockets=[listener], threads=threads)
+    metrics.watch_waitress(server)
+
+    def drain(signum, frame):
+        if health_state['draining']:
+            return
+        health_state['draining'] = True
+        logging.info("Worker %d draining", os.getpid())
+        #Stop accepting here only, the other workers keep using the shared socket
+        server.accepting = False
+        server.del_channel()
+
+    def busy():
+        return any(isinstance(channel, HTTPChannel) and (channel.requests or channel.total_outbufs_len)
+                   for channel in list(server._map.values()))
+
+    signal.signal(signal.SIGTERM, drain)
+    os.write(ready_fd, b'1')
+    os.close(ready_fd)
+
+    deadline = None
+    while True:
+        server.asyncore.loop(timeout=1, map=server._map, use_poll=server.adj.asyncore_use_poll, count=1)
+        if health_state['draining']:
+            deadline = deadline or time.monotonic() + graceful_timeout
+            if not busy() or time.monotonic() > deadline:
+                break
+
+    server.task_dispatcher.shutdown(cancel_pending=False, timeout=max(0, deadline - time.monotonic()))
+    #Workers leave through os._exit, which skips atexit handlers, so the buffered writes are flushed here
+    user_repository.write_buffer.flush()
+    sys.exit(0)
@@ -0,0 +1,228 @@
+#Extra storage backends for Flask-Limiter, selected with RATELIMIT_STORAGE_URI:
+#  sharded-memory://?shards=16        counters in this process only (single process deployments). Every pre-forked
+#                                     worker (WEB_WORKERS) counts on its own, so a limit is effectively multiplied by their number
+#  hybrid+mongodb://host/db?sync=1    local counters, synced with the shared storage every `sync` seconds
+#Importing this module registers the schemes with the limits storage registry.
+import logging, os, threading, time, zlib
+from urllib.parse import parse_qs, urlparse
+
+from limits.storage import Storage, storage_from_string
+
+from src import config
+
+
+def _query_options(uri):
+    return {key: values[-1] for key, values in parse_qs(urlparse(uri).query).items()}
+
+
+class ShardedMemoryStorage(Storage):
+    """Fixed window counters kept in this process, split over independently locked shards.
+
+    Unlike limits' MemoryStorage there is no global lock and no expiry timer thread,
+    expired counters are dropped when they're read or during an occasional sweep.
+    """
+
+    STORAGE_SCHEME = ['sharded-memory']
+    SWEEP_EVERY = 1024 # increments per shard
+
+    def __init__(self, uri=None, wrap_exceptions=False, **options):
+        shards = int(_query_options(uri or '').get('shards', options.get('shards', 16)))
+        self.shards = [({}, threading.Lock()) for _ in range(shards)]
+        self._increments = [0] * shards
+        super().__init__(uri, wrap_exceptions=wrap_exceptions)
+
+        if config.PRODUCTION and config.WEB_WORKERS > 1:
+            logging.warning("sharded-memory:// rate limits are counted per process, with %d workers every limit allows %d times as many requests",
+                            config.WEB_WORKERS, config.WEB_WORKERS)
+
+    @property
+    def base_exceptions(self):
+        return ValueError
+
+    def _shard(self, key):
+        index = zlib.crc32(key.encode('utf-8')) % len(self.shards)
+        return index, self.shards[index]
+
+    def _sweep(self, counters, now):
+        for key in [key for key, (_, expires_at) in counters.items() if expires_at <= now]:
+            del counters[key]
+
+    def incr(self, key, expiry, elastic_expiry=False, amount=1):
+        index, (counters, lock) = self._shard(key)
+        now = time.time()
+        with lock:
+            count, expires_at = counters.get(key, (0, 0))
+            if expires_at <= now:
+                count, expires_at = 0, now + expiry
+            elif elastic_expiry:
+                expires_at = now + expiry
+
+            count += amount
+            counters[key] = (count, expires_at)
+
+            self._increments[index] += 1
+            if self._increments[index] % self.SWEEP_EVERY == 0:
+                self._sweep(counters, now)
+            return count
+
+    def get(self, key):
+        _, (counters, lock) = self._shard(key)
+        with lock:
+            count, expires_at = counters.get(key, (0, 0))
+            return count if expires_at > time.time() else 0
+
+    def get_expiry(self, key):
+        _, (counters, lock) = self._shard(key)
+        with lock:
+            _, expires_at = counters.get(key, (0, time.time()))
+            return int(expires_at)
+
+    def check(self):
+        return True
+
+    def reset(self):
+        removed = 0
+        for counters, lock in self.shards:
+            with lock:
+                removed += len(counters)
+                counters.clear()
+        return removed
+
+    def clear(self, key):
+        _, (counters, lock) = self._shard(key)
+        with lock:
+            counters.pop(key, None)
+
+
+class HybridStorage(Storage):
+    """Counts hits locally and pushes them to a shared storage every `sync` seconds.
+
+    The first hit on a key in a window reads the shared count, after that hits are
+    checked against the last known shared count plus the local hits, so a limited
+    request normally doesn't wait on the shared storage at all. Between two syncs
+    each process can let through up to its own share of extra hits, so limits are
+    approximate across processes (exact within one).
+    """
+
+    STORAGE_SCHEME = [f'hybrid+{scheme}' for scheme in ('mongodb', 'mongodb+srv', 'redis', 'rediss', 'redis+unix', 'memcached', 'memory')]
+
+    def __init__(self, uri, wrap_exceptions=False, **options):
+        query = _query_options(uri)
+        self.sync_interval = float(query.pop('sync', options.pop('sync', 1)))
+
+        remote_uri = uri[len('hybrid+'):]
+        if 'sync=' in remote_uri:
+            parsed = urlparse(remote_uri)
+            remote_uri = parsed._replace(query='&'.join(f'{key}={value}' for key, value in query.items())).geturl()
+        self.remote = storage_from_string(remote_uri, **options)
+
+        #key -> {'base': shared count at the last sync, 'delta': local hits not synced yet, 'expires_at', 'expiry'}
+        self.counters = {}
+        self._counters_lock = threading.Lock()
+        self._thread_pid = None
+        self.stats = {
+            'local_hits': 0,
+            'remote_reads': 0,
+            'syncs': 0,
+            'sync_errors': 0
+        }
+        super().__init__(uri, wrap_exceptions=wrap_exceptions)
+
+    @property
+    def base_exceptions(self):
+        return self.remote.base_exceptions
+
+    def _ensure_thread(self):
+        if self._thread_pid != os.getpid():
+            with self._counters_lock:
+                if self._thread_pid != os.getpid():
+                    threading.Thread(target=self._run, name='rate-limit-sync', daemon=True).start()
+                    self._thread_pid = os.getpid()
+
+    def _run(self):
+        while True:
+            time.sleep(self.sync_interval)
+            self.sync()
+
+    def _entry(self, key, expiry):
+        now = time.time()
+        with self._counters_lock:
+            entry = self.counters.get(key)
+            if entry is not None and entry['expires_at'] > now:
+                return entry
+
+        #Unknown key (or a new window), start from the shared count
+        self.stats['remote_reads'] += 1
+        base = self.remote.get(key)
+        expires_at = self.remote.get_expiry(key) if base else now + expiry
+        with self._counters_lock:
+            entry = self.counters.get(key)
+            if entry is None or entry['expires_at'] <= now:
+                entry = self.counters[key] = {'base': base, 'delta': 0, 'expires_at': expires_at, 'expiry': expiry}
+            return entry
+
+    def incr(self, key, expiry, elastic_expiry=False, amount=1):
+        self._ensure_thread()
+        entry = self._entry(key, expiry)
+        with self._counters_lock:
+            entry['delta'] += amount
+            if elastic_expiry:
+                entry['expires_at'] = time.time() + expiry
+            self.stats['local_hits'] += 1
+            return entry['base'] + entry['delta']
+
+    def get(self, key):
+        with self._counters_lock:
+            entry = self.counters.get(key)
+            if entry is not None and entry['expires_at'] > time.time():
+                return entry['base'] + entry['delta']
+        return self.remote.get(key)
+
+    def get_expiry(self, key):
+        with self._counters_lock:
+            entry = self.counters.get(key)
+            if entry is not None and entry['expires_at'] > time.time():
+                return int(entry['expires_at'])
+        return self.remote.get_expiry(key)
+
+    def sync(self):
+        """Push local hits to the shared storage and pick up the hits of other processes."""
+        now = time.time()
+        with self._counters_lock:
+            for key in [key for key, entry in self.counters.items() if entry['expires_at'] <= now]:
+                del self.counters[key]
+            pending = [(key, entry, entry['delta']) for key, entry in self.counters.items() if entry['delta']]
+            for _, entry, delta in pending:
+                entry['base'] += delta
+                entry['delta'] -= delta
+
+        for key, entry, delta in pending:
+            try:
+                total = self.remote.incr(key, entry['expiry'], amount=delta)
+            except Exception as e:
+                #Keep the hits, they're pushed with the next sync
+                with self._counters_lock:
+                    entry['base'] -= delta
+                    entry['delta'] += delta
+                self.stats['sync_errors'] += 1
+                logging.warning("Could not sync rate limit counter %s: %s", key, e)
+                continue
+
+            with self._counters_lock:
+                entry['base'] = total
+
+        self.stats['syncs'] += 1
+        return len(pending)
+
+    def check(self):
+        return self.remote.check()
+
+    def reset(self):
+        with self._counters_lock:
+            self.counters.clear()
+        return self.remote.reset()
+
+    def clear(self, key):
+        with self._counters_lock:
+            self.counters.pop(key, None)
+        self.remote.clear(key)
@@ -0,0 +1,217 @@
+import logging, queue, smtplib, socket, threading, time
+
+from flask import current_app
+from flask_mail import email_dispatched, sanitize_address, sanitize_addresses
+
+from src.metrics import Histogram
+
+
+#Errors after which the connection is thrown away and the message retried on a fresh one.
+#Not OSError as a whole, every SMTPException is one, a rejected message says nothing about the connection
+RECONNECT_ERRORS = (smtplib.SMTPServerDisconnected, smtplib.SMTPConnectError, smtplib.SMTPHeloError, ConnectionError, socket.timeout)
+
+
+class SMTPConnectionPool():
+    """Keeps a few authenticated SMTP sessions open and sends Flask-Mail messages over them.
+
+    Flask-Mail opens a new connection (and TLS session) per message, here a message only
+    pays for the SMTP transaction itself. A batch is always sent over a single connection.
+    """
+
+    def __init__(self):
+        self.send_latency = Histogram()
+        self.stats = {
+            'sent': 0,
+            'failed': 0,
+            'connections_opened': 0,
+            'reconnects': 0
+        }
+
+        self._pool = queue.LifoQueue()
+        self._open_connections = 0
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        self.server = app.config.get('MAIL_SERVER', 'localhost')
+        self.port = app.config.get('MAIL_PORT', 25)
+        self.use_tls = app.config.get('MAIL_USE_TLS', False)
+        self.use_ssl = app.config.get('MAIL_USE_SSL', False)
+        self.username = app.config.get('MAIL_USERNAME')
+        self.password = app.config.get('MAIL_PASSWORD')
+        self.default_sender = app.config.get('MAIL_DEFAULT_SENDER')
+        self.suppress = app.config.get('MAIL_SUPPRESS_SEND', app.testing)
+
+        self.size = app.config.get('MAIL_POOL_SIZE', 2)
+        self.timeout = app.config.get('MAIL_POOL_TIMEOUT', 10)
+        self.max_idle = app.config.get('MAIL_POOL_MAX_IDLE', 60)
+
+    def _connect(self):
+        if self.use_ssl:
+            host = smtplib.SMTP_SSL(self.server, self.port, timeout=self.timeout)
+        else:
+            host = smtplib.SMTP(self.server, self.port, timeout=self.timeout)
+
+        if self.use_tls:
+            host.starttls()
+
+        if self.username and self.password:
+            host.login(self.username, self.password)
+
+        self.stats['connections_opened'] += 1
+        return host
+
+    def _is_alive(self, host, idle_since):
+        if time.monotonic() - idle_since < self.max_idle:
+            return True
+        #Servers drop idle sessions, check before reusing one that sat around for a while
+        try:
+            return host.noop()[0] == 250
+        except OSError:
+            return False
+
+    def _acquire(self):
+        while True:
+            try:
+                host, idle_since = self._pool.get_nowait()
+            except queue.Empty:
+                break
+
+            if self._is_alive(host, idle_since):
+                return host
+            self._discard(host)
+
+        with self._lock:
+            can_open = self._open_connections < self.size
+            if can_open:
+                self._open_connections += 1
+
+        if can_open:
+            try:
+                return self._connect()
+            except Exception:
+                with self._lock:
+                    self._open_connections -= 1
+                raise
+
+        #Pool is at capacity, wait for another sender to give a connection back
+        host, idle_since = self._pool.get(timeout=self.timeout)
+        if self._is_alive(host, idle_since):
+            return host
+        return self._reconnect(host)
+
+    def _release(self, host):
+        self._pool.put((host, time.monotonic()))
+
+    def _discard(self, host):
+        try:
+            host.quit()
+        except Exception:
+            pass
+        with self._lock:
+            self._open_connections -= 1
+
+    def _reconnect(self, host):
+        try:
+            host.close()
+        except Exception:
+            pass
+        self.stats['reconnects'] += 1
+        try:
+            return self._connect()
+        except Exception:
+            with self._lock:
+                self._open_connections -= 1
+            raise
+
+    def _sendmail(self, host, message):
+        start = time.perf_counter()
+        host.sendmail(
+            sanitize_address(message.sender or self.default_sender),
+            list(sanitize_addresses(message.send_to)),
+            message.as_bytes(),
+            message.mail_options,
+            message.rcpt_options
+        )
+        self.send_latency.observe(time.perf_counter() - start)
+
+    def send(self, message):
+        failed = self.send_batch([message])
+        if failed:
+            raise smtplib.SMTPException(f"Could not send email to {', '.join(message.send_to)}")
+
+    def send_batch(self, messages):
+        """Send all messages over one connection, returns the messages that could not be sent."""
+        if not messages:
+            return []
+
+        for message in messages:
+            if message.date is None:
+                message.date = time.time()
+
+        if self.suppress:
+            for message in messages:
+                email_dispatched.send(current_app._get_current_object(), message=message)
+            return []
+
+        try:
+            host = self._acquire()
+        except (queue.Empty, smtplib.SMTPException, OSError) as e:
+            #SMTP server down or every pooled connection busy, the caller retries the whole batch
+            logging.error("No SMTP connection available: %s", e)
+            self.stats['failed'] += len(messages)
+            return list(messages)
+
+        failed = []
+        for index, message in enumerate(messages):
+            try:
+                try:
+                    self._sendmail(host, message)
+                except RECONNECT_ERRORS as e:
+                    logging.warning("SMTP connection lost (%s), reconnecting", e)
+                    stale, host = host, None
+                    host = self._reconnect(stale)
+                    self._sendmail(host, message)
+            except smtplib.SMTPRecipientsRefused as e:
+                #Retrying won't help a refused recipient
+                logging.error("SMTP server refused recipients %s", list(e.recipients))
+                self.stats['failed'] += 1
+                continue
+            except RECONNECT_ERRORS as e:
+                #No usable connection, hand the rest of the batch back to the caller
+                logging.error("SMTP connection could not be reestablished: %s", e)
+                if host is not None:
+                    self._discard(host)
+                self.stats['failed'] += len(messages) - index
+                return failed + messages[index:]
+            except smtplib.SMTPException as e:
+                if host is None:
+                    #The reconnect itself failed (e.g. SMTPAuthenticationError), the connection is already given up
+                    logging.error("SMTP connection could not be reestablished: %s", e)
+                    self.stats['failed'] += len(messages) - index
+                    return failed + messages[index:]
+                #Only this message was rejected (SMTPDataError, SMTPSenderRefused, ...), the session is still usable
+                logging.error("Failed to send email to %s: %s", message.send_to, e)
+                failed.append(message)
+                self.stats['failed'] += 1
+                continue
+            except OSError as e:
+                #Anything else from the socket (e.g. an SSL error) leaves the session in an unknown state
+                logging.error("SMTP connection failed: %s", e)
+                if host is not None:
+                    self._discard(host)
+                self.stats['failed'] += len(messages) - index
+                return failed + messages[index:]
+
+            self.stats['sent'] += 1
+            email_dispatched.send(current_app._get_current_object(), message=message)
+
+        self._release(host)
+        return failed
+
+    def close(self):
+        while True:
+            try:
+                host, _ = self._pool.get_nowait()
+            except queue.Empty:
+                return
+            self._discard(host)
@@ -0,0 +1,195 @@
+#Logging pipeline: request threads only put records on a queue, a listener thread formats them and does
+#the disk and console I/O. app.log gets one JSON object per line and is rotated by size, the console still gets
+#the plain messages. Messages are formatted on the listener thread too, so log with %-style arguments
+#(logging.info("Sent %s", x)) rather than f-strings to keep the formatting off the request.
+#Pre-forked workers (src/prefork.py) don't write app.log themselves, they send their records to the master
+#(LogReceiver), so a single process writes and rotates the file.
+import json, logging, os, pickle, queue, random, socket, threading
+from datetime import datetime, timezone
+from logging.handlers import DatagramHandler, QueueHandler, QueueListener, RotatingFileHandler
+
+from flask import has_request_context, request
+
+
+#Attributes every LogRecord has, anything else was passed with extra={...}
+STANDARD_ATTRIBUTES = set(logging.LogRecord('', 0, '', 0, '', (), None).__dict__) | {'message', 'asctime'}
+
+
+class JSONFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            'time': datetime.fromtimestamp(record.created, tz=timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'module': record.module,
+            'line': record.lineno,
+            'pid': record.process,
+            'message': record.getMessage()
+        }
+        for key, value in record.__dict__.items():
+            if key not in STANDARD_ATTRIBUTES:
+                entry[key] = value
+
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry['exception'] = record.exc_text
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+
+class SamplingFilter(logging.Filter):
+    """Keeps only a fraction of the records below WARNING for noisy loggers.
+
+    Rates are looked up by logger name, then by module (most of the code logs through the root logger).
+    """
+
+    def __init__(self, rates):
+        super().__init__()
+        self.rates = dict(rates)
+
+    def filter(self, record):
+        if record.levelno >= logging.WARNING or not self.rates:
+            return True
+        rate = self.rates.get(record.name, self.rates.get(record.module))
+        return rate is None or random.random() < rate
+
+
+class NonBlockingQueueHandler(QueueHandler):
+    """QueueHandler that never waits: records are dropped (and counted) when the queue is full.
+
+    The listener thread doesn't survive a fork, so each process starts its own on first use.
+    """
+
+    def __init__(self, handlers, maxsize):
+        super().__init__(queue.Queue(maxsize))
+        self.handlers = handlers
+        self.maxsize = maxsize
+        self.dropped = 0
+        self.listener = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def _ensure_listener(self):
+        if self._pid != os.getpid():
+            with self._lock:
+                if self._pid != os.getpid():
+                    #Records copied from the parent process were already handled there
+                    self.queue = queue.Queue(self.maxsize)
+                    self.listener = QueueListener(self.queue, *self.handlers, respect_handler_level=True)
+                    self.listener.start()
+                    self._pid = os.getpid()
+
+    def prepare(self, record):
+        #Unlike QueueHandler.prepare the message isn't formatted here, the listener does that.
+        #Records stay in this process, so the arguments don't need to be pickled.
+        if has_request_context():
+            record.method = request.method
+            record.path = request.path
+            record.remote_addr = request.remote_addr
+        return record
+
+    def enqueue(self, record):
+        self._ensure_listener()
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+    def close(self):
+        #Called by logging.shutdown() at exit, writes out what's still queued
+        with self._lock:
+            if self.listener is not None and self._pid == os.getpid():
+                self.listener.stop()
+                self.listener = None
+                self._pid = None
+        super().close()
+
+
+#Largest record a worker can send to the master, also the socket's send buffer
+MAX_FORWARDED_RECORD = 256 * 1024 # bytes
+
+
+class ForwardingHandler(DatagramHandler):
+    """Sends every record (pickled like SocketHandler does) as one datagram over a socket inherited from the master."""
+
+    def __init__(self, sock):
+        super().__init__(None, None)
+        self.sock = sock
+
+    def send(self, s):
+        self.sock.send(s)
+
+    def close(self):
+        #The socket isn't closed: logging.shutdown() closes this handler before the queue handler writes out its last records
+        logging.Handler.close(self)
+
+
+class LogReceiver():
+    """Writes the records of pre-forked workers to the master's file handlers.
+
+    Created in the master before the first fork, every worker calls forward() right after it's forked.
+    Datagrams are never interleaved, so all workers share one socket.
+    """
+
+    def __init__(self, queue_handler):
+        self.queue_handler = queue_handler
+        self.file_handlers = [handler for handler in queue_handler.handlers if isinstance(handler, logging.FileHandler)]
+
+        self.sock, self.worker_sock = socket.socketpair(socket.AF_UNIX, socket.SOCK_DGRAM)
+        self.worker_sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, MAX_FORWARDED_RECORD)
+        threading.Thread(target=self._run, name='log-receiver', daemon=True).start()
+
+    def _run(self):
+        while True:
+            try:
+                data = self.sock.recv(MAX_FORWARDED_RECORD)
+            except OSError:
+                return
+            self.handle(data)
+
+    def handle(self, data):
+        #makePickle prefixes the length, a datagram is always complete
+        record = logging.makeLogRecord(pickle.loads(data[4:]))
+        for handler in self.file_handlers:
+            if record.levelno >= handler.level:
+                handler.handle(record)
+
+    def forward(self):
+        """Called in a freshly forked worker: its records go to the master instead of the log file."""
+        self.sock.close()
+        for handler in self.file_handlers:
+            #Opened by the master, the worker must not keep a file the master renames away
+            handler.close()
+        self.queue_handler.handlers = [ForwardingHandler(self.worker_sock) if handler in self.file_handlers else handler
+                                       for handler in self.queue_handler.handlers]
+
+    def close(self):
+        #The workers are gone, write out whatever they sent last
+        self.sock.setblocking(False)
+        while True:
+            try:
+                data = self.sock.recv(MAX_FORWARDED_RECORD)
+            except OSError:
+                return
+            self.handle(data)
+
+
+def queue_handler():
+    """The NonBlockingQueueHandler set up by setup_logging, None if logging wasn't set up."""
+    return next((handler for handler in logging.getLogger().handlers if isinstance(handler, NonBlockingQueueHandler)), None)
+
+
+def setup_logging(level, filename, max_bytes, backup_count, queue_size, sample_rates):
+    #Opened on the first record, not when src.config is imported
+    file_handler = RotatingFileHandler(filename, maxBytes=max_bytes, backupCount=backup_count, encoding='utf-8', delay=True)
+    file_handler.setFormatter(JSONFormatter())
+
+    console_handler = logging.StreamHandler()
+
+    handler = NonBlockingQueueHandler([file_handler, console_handler], queue_size)
+    handler.addFilter(SamplingFilter(sample_rates))
+
+    root = logging.getLogger()
+    root.setLevel(level)
+    root.addHandler(handler)
+    return handler
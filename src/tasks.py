@@ -1,9 +1,62 @@
 from celery import shared_task
-import logging
+import logging, queue, smtplib
+from concurrent.futures import ThreadPoolExecutor
+
+from flask import render_template, current_app
+from flask_mail import Message
+
+from src.extensions import smtp_pool
+from src.celery_app import ensure_celery
+from src import config
+
 
 @shared_task
 def add_together(x, y, *args, **kwargs):
-    logging.info(f"Adding {str(x)} and {str(y)}")
-    logging.info(f"args: {str(args)}")
-    logging.info(f"kwargs: {str(kwargs)}")
-    return x + y
\ No newline at end of file
+    logging.info("Adding %s and %s", x, y)
+    logging.info("args: %s", args)
+    logging.info("kwargs: %s", kwargs)
+    return x + y
+
+
+@shared_task(
+    autoretry_for=(smtplib.SMTPException, OSError, queue.Empty),
+    retry_backoff=True,
+    retry_backoff_max=300,
+    max_retries=5,
+    ignore_result=True
+)
+def send_email(subject, recipients, html):
+    smtp_pool.send(build_message(subject, recipients, html))
+    logging.info("Sent email '%s' to %d recipient(s)", subject, len(recipients))
+
+
+#Without a broker tasks run eagerly, this thread sends them (retries included) so the request doesn't wait on SMTP
+_eager_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='eager-email')
+
+
+def _apply_eager(task, args):
+    try:
+        task.delay(*args)
+    except Exception:
+        logging.exception("Task %s failed, the email was not sent", task.name)
+
+
+def _delay(task, *args):
+    if config.CELERY_TASK_ALWAYS_EAGER:
+        _eager_executor.submit(_apply_eager, task, args)
+    else:
+        task.delay(*args)
+
+
+def build_message(subject, recipients, html):
+    msg = Message(subject, sender=config.MAIL_DEFAULT_SENDER, recipients=recipients)
+    msg.html = html
+    return msg
+
+
+def queue_email(subject, recipients, template, **context):
+    """Render the email inside the current request and hand it off to a Celery worker."""
+    html = render_template(template, **context)
+    ensure_celery(current_app._get_current_object())
+    _delay(send_email, subject, recipients, html)
+
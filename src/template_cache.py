@@ -0,0 +1,132 @@
+#Compiled templates (Jinja bytecode) and minified template sources on disk, so a new process doesn't parse,
+#compile and minify every template again. Filled at image build time with `python -m src.template_cache`
+#(see Dockerfile) or `flask templates precompile`, templates changed since then are compiled and stored on first use.
+import hashlib, logging, os, tempfile, threading
+
+from flask import has_request_context
+from jinja2 import FileSystemBytecodeCache
+
+
+BYTECODE_PATTERN = '%s.jinja'
+SOURCE_SUFFIX = '.min.html'
+
+
+def write_atomic(path, data):
+    #Other workers may read the file at the same time, they see either nothing or all of it
+    fd, temporary = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            f.write(data)
+        os.replace(temporary, path)
+    except BaseException:
+        os.remove(temporary)
+        raise
+
+
+class TemplateBytecodeCache(FileSystemBytecodeCache):
+    """FileSystemBytecodeCache that counts cache hits and compilations, and keeps working when the directory is read-only."""
+
+    def __init__(self, directory):
+        super().__init__(directory, BYTECODE_PATTERN)
+        self.stats = {'loaded': 0, 'compiled': 0, 'compiled_in_request': 0}
+        self._lock = threading.Lock()
+
+    def load_bytecode(self, bucket):
+        super().load_bytecode(bucket)
+        #No code means Jinja compiles the template right after this
+        with self._lock:
+            if bucket.code is not None:
+                self.stats['loaded'] += 1
+            else:
+                self.stats['compiled'] += 1
+                if has_request_context():
+                    self.stats['compiled_in_request'] += 1
+
+    def dump_bytecode(self, bucket):
+        try:
+            super().dump_bytecode(bucket)
+        except OSError as e:
+            logging.warning("Could not store compiled template in %s: %s", self.directory, e)
+
+
+class TemplateCache():
+    def __init__(self):
+        self.directory = None
+        self.bytecode_cache = None
+
+    def init_app(self, app):
+        #Has to run before any template is loaded, templates already in the Jinja cache would never be stored
+        directory = app.config.get('TEMPLATE_CACHE_DIR')
+        if not directory:
+            return
+
+        directory = os.path.join(app.root_path, directory)
+        try:
+            os.makedirs(directory, exist_ok=True)
+        except OSError as e:
+            logging.warning("Template cache disabled, could not create %s: %s", directory, e)
+            return
+
+        self.directory = directory
+        self.bytecode_cache = TemplateBytecodeCache(directory)
+        app.jinja_env.bytecode_cache = self.bytecode_cache
+
+    def source_path(self, name, source):
+        return os.path.join(self.directory, hashlib.sha1(f'{name}\0{source}'.encode('utf-8')).hexdigest() + SOURCE_SUFFIX)
+
+    def load_source(self, name, source):
+        """Minified version of a template source stored by dump_source, None if there is none."""
+        try:
+            with open(self.source_path(name, source), encoding='utf-8') as f:
+                return f.read()
+        except OSError:
+            return None
+
+    def dump_source(self, name, source, minified):
+        try:
+            write_atomic(self.source_path(name, source), minified)
+        except OSError as e:
+            logging.warning("Could not store minified template in %s: %s", self.directory, e)
+
+    def clear(self):
+        self.bytecode_cache.clear()
+        for filename in os.listdir(self.directory):
+            if filename.endswith(SOURCE_SUFFIX):
+                os.remove(os.path.join(self.directory, filename))
+
+    def precompile(self, app):
+        """Compile (and minify, in production) every template of the app into an empty cache, returns the template names."""
+        if self.bytecode_cache is None:
+            raise RuntimeError("The template cache is disabled, set TEMPLATE_CACHE_DIR")
+
+        self.clear()
+        app.jinja_env.cache.clear()
+        names = app.jinja_env.list_templates()
+        for name in names:
+            app.jinja_env.get_template(name)
+        return names
+
+
+#Placeholders for the required settings when run at image build time, only the app's Jinja environment is used
+BUILD_ENVIRONMENT = {
+    'PRODUCTION': 'true',
+    'PORT': '5000',
+    'MONGO_URI': 'mongodb://localhost:27017/template_cache',
+    'SECRET_KEY': 'template-cache',
+    'SERIALIZER_SECRET_KEY': 'template-cache',
+    'MAIL_SERVER': 'localhost',
+    'MAIL_USERNAME': 'template-cache',
+    'MAIL_PASSWORD': 'template-cache',
+}
+
+
+if __name__ == '__main__':
+    for key, value in BUILD_ENVIRONMENT.items():
+        os.environ.setdefault(key, value)
+
+    from server import create_app
+    from src.extensions import template_cache
+
+    app = create_app()
+    names = template_cache.precompile(app)
+    print(f"Precompiled {len(names)} templates into {template_cache.directory}")
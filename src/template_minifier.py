@@ -0,0 +1,130 @@
+import logging, re, time
+
+from flask import g, before_render_template
+from jinja2 import BaseLoader, TemplateSyntaxError
+
+
+#Jinja syntax is swapped for placeholders while the HTML is minified, lowercase because htmlmin lowercases attribute names
+PLACEHOLDER = 'jinjaph{}x'
+PLACEHOLDER_PATTERN = re.compile(r'jinjaph(\d+)x')
+HTML_COMMENT_PATTERN = re.compile(r'<!--.*?-->', re.DOTALL)
+
+
+def jinja_syntax_pattern(environment):
+    block_start, block_end = re.escape(environment.block_start_string), re.escape(environment.block_end_string)
+    variable_start, variable_end = re.escape(environment.variable_start_string), re.escape(environment.variable_end_string)
+    comment_start, comment_end = re.escape(environment.comment_start_string), re.escape(environment.comment_end_string)
+
+    return re.compile(
+        #{% raw %} blocks are kept as they are, including their content
+        rf'{block_start}-?\s*raw\s*-?{block_end}.*?{block_start}-?\s*endraw\s*-?{block_end}'
+        rf'|{block_start}.*?{block_end}'
+        rf'|{variable_start}.*?{variable_end}'
+        rf'|{comment_start}.*?{comment_end}',
+        re.DOTALL
+    )
+
+
+def minify_template(environment, source, name=None):
+    """Minify the HTML of a Jinja template source, returns None if it can't be done safely."""
+    if PLACEHOLDER_PATTERN.search(source):
+        return None
+
+    from flask_minify.parsers import Parser
+    parser = Parser(fail_safe=True)
+    parser.update_runtime_options(html=True, js=True, cssless=True)
+
+    tags = []
+    def protect(match):
+        tags.append(match.group(0))
+        return PLACEHOLDER.format(len(tags) - 1)
+
+    protected = jinja_syntax_pattern(environment).sub(protect, source)
+    minified = parser.minify(protected, 'html')
+
+    #Tags inside HTML comments are dropped along with the comment, the runtime Minify would strip their output anyway
+    commented = {int(index) for comment in HTML_COMMENT_PATTERN.findall(protected) for index in PLACEHOLDER_PATTERN.findall(comment)}
+
+    restored = []
+    def restore(match):
+        index = int(match.group(1))
+        restored.append(index)
+        return tags[index] if index < len(tags) else match.group(0)
+
+    result = PLACEHOLDER_PATTERN.sub(restore, minified)
+
+    #Every other tag has to come back exactly once, otherwise the template could render differently
+    if sorted(restored + list(commented - set(restored))) != list(range(len(tags))):
+        logging.warning("Could not minify template %s, Jinja tags were not preserved", name)
+        return None
+
+    try:
+        environment.parse(result, name)
+    except TemplateSyntaxError as e:
+        logging.warning("Could not minify template %s: %s", name, e)
+        return None
+
+    return result
+
+
+class MinifyingLoader(BaseLoader):
+    """Wraps the app's template loader and hands Jinja minified HTML templates.
+
+    Jinja keeps the compiled templates in its cache, so each template is minified once
+    when it's first loaded (and again only when auto_reload notices a change).
+    With a template cache the minified sources are kept on disk too, Jinja needs the
+    source to validate the bytecode cache even when it doesn't compile it.
+    """
+
+    def __init__(self, loader, cache=None):
+        self.loader = loader
+        self.cache = cache
+        self.fallbacks = set()
+
+    def get_source(self, environment, template):
+        source, filename, uptodate = self.loader.get_source(environment, template)
+        if not template.endswith('.html'):
+            return source, filename, uptodate
+
+        minified = self.cache.load_source(template, source) if self.cache else None
+        if minified is None:
+            minified = minify_template(environment, source, template)
+            if minified is not None and self.cache:
+                self.cache.dump_source(template, source, minified)
+
+        if minified is None:
+            self.fallbacks.add(template)
+            return source, filename, uptodate
+
+        self.fallbacks.discard(template)
+        logging.debug("Minified template %s (%d -> %d chars)", template, len(source), len(minified))
+        return minified, filename, uptodate
+
+    def list_templates(self):
+        return self.loader.list_templates()
+
+
+class TemplateMinifier():
+    """Minifies the templates instead of every rendered response, so the runtime Minify can be skipped."""
+
+    def __init__(self):
+        self.loader = None
+
+    def init_app(self, app, cache=None):
+        if not app.config.get('MINIFY_TEMPLATES', True):
+            return
+
+        self.loader = MinifyingLoader(app.jinja_env.loader, cache if cache is not None and cache.directory else None)
+        app.jinja_env.loader = self.loader
+        before_render_template.connect(self.skip_runtime_minify, app)
+
+        #Minify everything up front, this way fallbacks (which could be any parent layout) are known before the first request
+        start = time.perf_counter()
+        for name in app.jinja_env.list_templates(extensions=['html']):
+            app.jinja_env.get_template(name)
+        logging.info("Minified templates in %.2fs, %d left as they are", time.perf_counter() - start, len(self.loader.fallbacks))
+
+    def skip_runtime_minify(self, sender, template, context, **extra):
+        #A page renders its layouts and includes too, so only skip when none of them fell back
+        if not self.loader.fallbacks:
+            g.skip_minify = True
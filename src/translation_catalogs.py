@@ -0,0 +1,101 @@
+import io, logging, os, time
+
+from babel import support
+from babel.messages.mofile import write_mo
+from babel.messages.pofile import read_po
+from flask import has_request_context
+from flask_babel import get_babel, get_translations
+from jinja2 import pass_context
+from markupsafe import Markup
+
+from src.config import ACCEPTED_LANGUAGES
+from src.localization import get_locale
+
+
+def load_catalog(directory, language, domain):
+    """Load translations/<language>/LC_MESSAGES/<domain>.mo, compiled from the .po file in memory when it's missing or older."""
+    base = os.path.join(directory, language, 'LC_MESSAGES', domain)
+    mo_path, po_path = base + '.mo', base + '.po'
+
+    if os.path.exists(mo_path) and (not os.path.exists(po_path) or os.path.getmtime(mo_path) >= os.path.getmtime(po_path)):
+        with open(mo_path, 'rb') as f:
+            return support.Translations(f, domain=domain)
+
+    if os.path.exists(po_path):
+        with open(po_path, 'rb') as f:
+            catalog = read_po(f, locale=language, domain=domain)
+        buffer = io.BytesIO()
+        write_mo(buffer, catalog) # fuzzy entries are left out, like `pybabel compile`
+        buffer.seek(0)
+        return support.Translations(buffer, domain=domain)
+
+    return None
+
+
+class TranslationCatalogs():
+    """Loads every catalog of ACCEPTED_LANGUAGES when the app starts instead of on the first request of each locale.
+
+    Flask-Babel's own cache is filled with them (gettext() in Python code), and templates get a gettext
+    that looks the already escaped fragment up in a per-locale dict instead of going through Flask-Babel's
+    context, locale and domain lookups for every _() call.
+    """
+
+    def __init__(self):
+        self.translations = {}
+        #locale -> {msgid: translated string}, and the same as Markup with the formatting already applied
+        self.messages = {}
+        self.fragments = {}
+        self.default_locale = 'en'
+
+    def init_app(self, app):
+        if not app.config.get('PRELOAD_TRANSLATIONS', True):
+            return
+
+        start = time.perf_counter()
+        babel_config = get_babel(app)
+        with app.app_context():
+            domain = babel_config.instance.domain_instance
+        self.default_locale = babel_config.default_locale
+
+        for language in ACCEPTED_LANGUAGES:
+            translations = support.Translations(domain=babel_config.default_domain)
+            for directory in babel_config.translation_directories:
+                catalog = load_catalog(directory, language, babel_config.default_domain)
+                if catalog is not None:
+                    translations.merge(catalog)
+                    translations.plural = catalog.plural
+
+            self.translations[language] = translations
+            domain.cache[language, babel_config.default_domain] = translations
+
+        self.build_tables()
+        app.jinja_env.globals['gettext'] = app.jinja_env.globals['_'] = self.gettext
+        logging.info("Loaded %d translation catalogs with %d messages in %.3fs", len(self.translations),
+                     sum(len(table) for table in self.messages.values()), time.perf_counter() - start)
+
+    def build_tables(self):
+        #Plural forms are keyed by (msgid, n) and the header by '', ngettext keeps going through Flask-Babel
+        msgids = {key for translations in self.translations.values() for key in translations._catalog if isinstance(key, str) and key}
+        for language, translations in self.translations.items():
+            catalog = translations._catalog
+            self.messages[language] = {msgid: catalog.get(msgid, msgid) for msgid in msgids}
+            #Jinja's newstyle gettext always %-formats the result, even without variables ('%%' -> '%')
+            self.fragments[language] = {msgid: Markup(message) % {} for msgid, message in self.messages[language].items()}
+
+    @pass_context
+    def gettext(self, context, string, **variables):
+        #Same result as the newstyle gettext Flask-Babel installs
+        if not has_request_context():
+            message = get_translations().ugettext(string)
+            if context.eval_ctx.autoescape:
+                message = Markup(message)
+            return message % variables
+
+        locale = get_locale() or self.default_locale
+        if context.eval_ctx.autoescape:
+            if not variables:
+                fragment = self.fragments.get(locale, {}).get(string)
+                if fragment is not None:
+                    return fragment
+            return Markup(self.messages.get(locale, {}).get(string, string)) % variables
+        return self.messages.get(locale, {}).get(string, string) % variables
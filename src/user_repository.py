@@ -0,0 +1,184 @@
+import logging
+from datetime import datetime, timezone
+from typing import Optional
+
+from pymongo import ASCENDING, IndexModel
+
+from src.extensions import mongo
+from src.write_buffer import WriteBuffer
+from src import config
+
+
+class UserRepository():
+    """All reads and writes on the users collection go through here.
+
+    Every lookup asks Mongo only for the fields its caller uses, so OAuth tokens,
+    metadata and usage stats are never sent over the wire unless needed.
+    """
+
+    #Fields needed to build a session User (load_user)
+    SESSION_PROJECTION = {
+        '_id': 0,
+        'alternative_id': 1,
+        'account_status': 1,
+        'email_verified': 1,
+        'email': 1,
+        'profile.profile_picture': 1,
+        'profile.name': 1,
+        'roles': 1,
+        'preferences.language': 1
+    }
+
+    #Fields needed to check a password and start a session
+    LOGIN_PROJECTION = {
+        'password': 1,
+        'auth_provider': 1,
+        'account_status': 1,
+        'email_verified': 1,
+        'alternative_id': 1,
+        'preferences.language': 1,
+        'security.failed_login_attempts': 1
+    }
+
+    VERIFICATION_PROJECTION = {
+        '_id': 0,
+        'alternative_id': 1,
+        'email_verified': 1
+    }
+
+    PASSWORD_RESET_PROJECTION = {
+        '_id': 0,
+        'alternative_id': 1,
+        'security.password_reset_token': 1
+    }
+
+    #Every filter used below must be backed by one of these indexes
+    #NOTE: password_reset_token_expires is a plain index, a TTL index would delete the whole user document
+    INDEXES = [
+        IndexModel([('email', ASCENDING)], name='email_unique', unique=True),
+        IndexModel([('alternative_id', ASCENDING)], name='alternative_id_unique', unique=True),
+        IndexModel([('security.password_reset_token_expires', ASCENDING)], name='password_reset_token_expires', sparse=True),
+    ] + [
+        IndexModel([(f'connections.{provider}.oauth_id', ASCENDING)], name=f'connections_{provider}_oauth_id', sparse=True)
+        for provider in config.OAUTH2_PROVIDERS
+    ]
+
+    def __init__(self):
+        #Non-critical updates that can be written behind, flushed in bulk
+        self.write_buffer = WriteBuffer(lambda: self.collection)
+
+    @property
+    def collection(self):
+        return mongo.db.users
+
+    def ensure_indexes(self):
+        """Create the declared indexes, a no-op for the ones that already exist."""
+        created = self.collection.create_indexes(self.INDEXES)
+        logging.info("Ensured users indexes: %s", ', '.join(created))
+        return created
+
+    def query_plans(self):
+        #(name, filter, projection) of every lookup this repository issues
+        return [
+            ('email_exists', {'email': ''}, {'_id': 1}),
+            ('find_for_session', {'alternative_id': ''}, self.SESSION_PROJECTION),
+            ('find_for_login', {'email': ''}, self.LOGIN_PROJECTION),
+            ('find_verification_state', {'email': ''}, self.VERIFICATION_PROJECTION),
+            ('find_password_reset_state', {'email': ''}, self.PASSWORD_RESET_PROJECTION),
+        ] + [
+            (f'find_for_oauth[{provider}]', {'email': ''}, self.oauth_projection(provider))
+            for provider in config.OAUTH2_PROVIDERS
+        ]
+
+    def verify_indexes(self):
+        """Explain every repository query and raise if any of them falls back to a COLLSCAN."""
+        collection_scans = []
+        for name, query, projection in self.query_plans():
+            plan = self.collection.find(query, projection).explain()
+            if 'COLLSCAN' in _plan_stages(plan.get('queryPlanner', {}).get('winningPlan', {})):
+                collection_scans.append(name)
+
+        if collection_scans:
+            raise RuntimeError(f"Queries on the users collection are not using an index: {', '.join(collection_scans)}")
+
+        logging.info("All users queries are covered by an index")
+
+    def oauth_projection(self, provider: str) -> dict:
+        #Only the oauth_id of the requested connection, never the stored tokens
+        return {
+            'alternative_id': 1,
+            'account_status': 1,
+            'email_verified': 1,
+            'auth_provider': 1,
+            'preferences.language': 1,
+            f'connections.{provider}.oauth_id': 1
+        }
+
+    def email_exists(self, email: str) -> bool:
+        return self.collection.find_one({'email': email}, {'_id': 1}) is not None
+
+    def find_for_session(self, alternative_id: str) -> Optional[dict]:
+        return self.collection.find_one({'alternative_id': alternative_id}, self.SESSION_PROJECTION)
+
+    def find_for_login(self, email: str) -> Optional[dict]:
+        return self.collection.find_one({'email': email}, self.LOGIN_PROJECTION)
+
+    def find_for_oauth(self, email: str, provider: str) -> Optional[dict]:
+        return self.collection.find_one({'email': email}, self.oauth_projection(provider))
+
+    def find_verification_state(self, email: str) -> Optional[dict]:
+        return self.collection.find_one({'email': email}, self.VERIFICATION_PROJECTION)
+
+    def find_password_reset_state(self, email: str) -> Optional[dict]:
+        return self.collection.find_one({'email': email}, self.PASSWORD_RESET_PROJECTION)
+
+    def insert(self, user: dict):
+        return self.collection.insert_one(user)
+
+    def update_by_id(self, user_id, update: dict):
+        return self.collection.update_one({'_id': user_id}, update)
+
+    def update_by_email(self, email: str, update: dict):
+        return self.collection.update_one({'email': email}, update)
+
+    def update_by_alternative_id(self, alternative_id: str, update: dict):
+        return self.collection.update_one({'alternative_id': alternative_id}, update)
+
+    def record_login(self, user: dict, ip: str, user_agent: str):
+        """A successful password login: the lockout counter is reset right away, the statistics are buffered."""
+        if user.get('security', {}).get('failed_login_attempts'):
+            self.update_by_id(user['_id'], {'$set': {'security.failed_login_attempts': 0}})
+
+        self.write_buffer.update({'_id': user['_id']}, {
+            '$set': {
+                'last_login': datetime.now(tz=timezone.utc),
+                'metadata.last_login_ip': ip,
+                'metadata.last_login_user_agent': user_agent
+            },
+            '$inc': {
+                'usage_stats.total_logins': 1
+            }
+        })
+
+    def record_failed_login(self, user: dict):
+        #failed_login_attempts is a security counter and is written synchronously, the total is just a statistic
+        self.update_by_id(user['_id'], {'$inc': {'security.failed_login_attempts': 1}})
+        self.write_buffer.update({'_id': user['_id']}, {'$inc': {'usage_stats.total_failed_logins': 1}})
+
+    def set_language(self, alternative_id: str, language: str):
+        #Buffered, a preference doesn't need to be persisted before the response is sent
+        self.write_buffer.update({'alternative_id': alternative_id}, {'$set': {'preferences.language': language}})
+
+
+def _plan_stages(plan):
+    #Stages are nested under inputStage/inputStages (and queryPlan on newer servers)
+    stages = [plan.get('stage')]
+    for key in ('inputStage', 'queryPlan'):
+        if key in plan:
+            stages += _plan_stages(plan[key])
+    for child in plan.get('inputStages', []):
+        stages += _plan_stages(child)
+    return stages
+
+
+user_repository = UserRepository()
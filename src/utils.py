@@ -1,3 +1,7 @@
+import cProfile, io, os, pstats, random, sys, threading, time
+from collections import defaultdict
+
+
 class ProxyFix:
     def __init__(self, app):
         self.app = app
@@ -10,4 +14,134 @@ class ProxyFix:
         if 'HTTP_X_REAL_IP' in environ:
             environ['REMOTE_ADDR'] = environ['HTTP_X_REAL_IP']
 
-        return self.app(environ, start_response)
\ No newline at end of file
+        return self.app(environ, start_response)
+
+class ProfilerMiddleware:
+    """Profiles a random sample of requests and aggregates the results per endpoint.
+
+    mode 'sampling': a background thread snapshots the stacks of the sampled requests every
+    `interval` seconds, the result is in the collapsed format read by flamegraph.pl and speedscope.
+    mode 'cprofile': every sampled request runs under cProfile, the stats are merged per endpoint.
+
+    The sample rate can be changed at runtime (admin /admin/profiler), 0 turns it off.
+    Every process profiles and aggregates on its own.
+    """
+
+    MAX_STACKS = 5000 # distinct stacks kept per endpoint
+
+    def __init__(self, app, url_map, sample_rate=0.0, mode='sampling', interval=0.005):
+        self.app = app
+        self.url_map = url_map
+        self.sample_rate = sample_rate
+        self.mode = mode
+        self.interval = interval
+
+        self.lock = threading.Lock()
+        self.active = {} # thread id -> endpoint, requests being sampled right now
+        self._sampler_pid = None
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.requests = defaultdict(int)
+            self.stacks = defaultdict(lambda: defaultdict(int)) # endpoint -> collapsed stack -> samples
+            self.stats = {} # endpoint -> pstats.Stats
+
+    def __call__(self, environ, start_response):
+        if self.sample_rate <= 0 or random.random() >= self.sample_rate:
+            return self.app(environ, start_response)
+
+        endpoint = self.endpoint(environ)
+        with self.lock:
+            self.requests[endpoint] += 1
+
+        if self.mode == 'cprofile':
+            profile = cProfile.Profile()
+            try:
+                return profile.runcall(self.app, environ, start_response)
+            finally:
+                self.add_stats(endpoint, profile)
+
+        self.ensure_sampler()
+        thread_id = threading.get_ident()
+        self.active[thread_id] = endpoint
+        try:
+            return self.app(environ, start_response)
+        finally:
+            self.active.pop(thread_id, None)
+
+    def endpoint(self, environ):
+        try:
+            endpoint, _ = self.url_map.bind_to_environ(environ).match()
+            return endpoint
+        except Exception:
+            #404, 405 and redirects, grouped so clients can't create endpoints at will
+            return 'none'
+
+    def add_stats(self, endpoint, profile):
+        with self.lock:
+            if endpoint in self.stats:
+                self.stats[endpoint].add(profile)
+            else:
+                self.stats[endpoint] = pstats.Stats(profile)
+
+    def ensure_sampler(self):
+        #Threads don't survive a fork, every process runs its own sampler
+        if self._sampler_pid != os.getpid():
+            with self.lock:
+                if self._sampler_pid != os.getpid():
+                    threading.Thread(target=self.sample_stacks, name='profiler', daemon=True).start()
+                    self._sampler_pid = os.getpid()
+
+    def sample_stacks(self):
+        own_code = ProfilerMiddleware.__call__.__code__
+        while True:
+            time.sleep(self.interval)
+            if not self.active:
+                continue
+
+            frames = sys._current_frames()
+            for thread_id, endpoint in list(self.active.items()):
+                frame = frames.get(thread_id)
+                stack = []
+                #Only the frames below this middleware belong to the request
+                while frame is not None and frame.f_code is not own_code:
+                    code = frame.f_code
+                    stack.append(f'{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})')
+                    frame = frame.f_back
+
+                if not stack:
+                    continue
+                collapsed = ';'.join(reversed(stack))
+                with self.lock:
+                    stacks = self.stacks[endpoint]
+                    if collapsed in stacks or len(stacks) < self.MAX_STACKS:
+                        stacks[collapsed] += 1
+
+    def summary(self):
+        with self.lock:
+            return {
+                'sample_rate': self.sample_rate,
+                'mode': self.mode,
+                'endpoints': {endpoint: {
+                    'requests': count,
+                    'samples': sum(self.stacks[endpoint].values()) if endpoint in self.stacks else 0
+                } for endpoint, count in sorted(self.requests.items())}
+            }
+
+    def collapsed_stacks(self, endpoint=None):
+        """Sampled stacks as `endpoint;frame;frame count` lines, ready for flamegraph.pl or speedscope."""
+        with self.lock:
+            lines = [f'{name};{stack} {count}' for name, stacks in self.stacks.items() if endpoint in (None, name)
+                     for stack, count in stacks.items()]
+        return '\n'.join(sorted(lines)) + '\n'
+
+    def cprofile_report(self, endpoint=None, sort='cumulative', limit=60):
+        output = io.StringIO()
+        with self.lock:
+            for name, stats in sorted(self.stats.items()):
+                if endpoint in (None, name):
+                    output.write(f'==== {name} ({self.requests[name]} requests)\n')
+                    stats.stream = output
+                    stats.sort_stats(sort).print_stats(limit)
+        return output.getvalue()
@@ -0,0 +1,113 @@
+import atexit, logging, os, threading
+
+from pymongo import UpdateOne
+from pymongo.errors import PyMongoError
+
+
+class WriteBuffer():
+    """Write-behind buffer for non-critical updates (preferences, counters, last-seen fields).
+
+    Updates are coalesced per filter ($inc values are added up, other operators keep the
+    latest value per field) and written with one unordered bulk_write every flush
+    interval, when too many documents are pending, or when the process exits.
+    Anything still pending when a process is killed is lost, so never buffer writes
+    that matter for security or correctness.
+    """
+
+    def __init__(self, get_collection):
+        self.get_collection = get_collection
+
+        self.stats = {
+            'queued': 0,
+            'coalesced': 0,
+            'flushes': 0,
+            'written': 0,
+            'failed': 0
+        }
+
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread_pid = None
+
+    def init_app(self, app):
+        self.interval = app.config.get('WRITE_BUFFER_FLUSH_INTERVAL', 5)
+        self.max_pending = app.config.get('WRITE_BUFFER_MAX_PENDING', 500)
+        atexit.register(self.flush)
+
+    def _ensure_thread(self):
+        #Threads don't survive a fork, every process runs its own flusher
+        if self._thread_pid != os.getpid():
+            with self._lock:
+                if self._thread_pid != os.getpid():
+                    threading.Thread(target=self._run, name='write-buffer', daemon=True).start()
+                    self._thread_pid = os.getpid()
+
+    def _run(self):
+        while True:
+            self._wake.wait(self.interval)
+            self._wake.clear()
+            #The thread isn't restarted, so nothing may end it or the pending updates would pile up
+            try:
+                self.flush()
+            except Exception:
+                logging.exception("Flushing buffered writes failed")
+
+    def update(self, filter: dict, update: dict):
+        """Queue an update_one(filter, update), merged with anything pending for the same filter."""
+        self._ensure_thread()
+
+        key = tuple(sorted(filter.items()))
+        with self._lock:
+            self.stats['queued'] += 1
+            if key in self._pending:
+                self.stats['coalesced'] += 1
+                _merge_update(self._pending[key][1], update)
+            else:
+                self._pending[key] = (filter, _merge_update({}, update))
+            full = len(self._pending) >= self.max_pending
+
+        if full:
+            self._wake.set()
+
+    def pending(self):
+        with self._lock:
+            return len(self._pending)
+
+    def flush(self):
+        with self._flush_lock:
+            with self._lock:
+                pending, self._pending = self._pending, {}
+
+            if not pending:
+                return 0
+
+            try:
+                operations = [UpdateOne(filter, update) for filter, update in pending.values()]
+                result = self.get_collection().bulk_write(operations, ordered=False)
+            except PyMongoError as e:
+                #Retrying could apply $inc twice when part of the batch went through
+                self.stats['failed'] += len(pending)
+                logging.error("Buffered write of %d updates failed: %s", len(pending), e)
+                return 0
+            except Exception:
+                self.stats['failed'] += len(pending)
+                logging.exception("Buffered write of %d updates failed", len(pending))
+                return 0
+
+            self.stats['flushes'] += 1
+            self.stats['written'] += len(operations)
+            logging.debug("Flushed %d buffered updates (%d modified)", len(operations), result.modified_count)
+            return len(operations)
+
+
+def _merge_update(pending, update):
+    for operator, fields in update.items():
+        target = pending.setdefault(operator, {})
+        if operator == '$inc':
+            for field, value in fields.items():
+                target[field] = target.get(field, 0) + value
+        else:
+            target.update(fields)
+    return pending